@@ -1,14 +1,43 @@
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import pandas as pd
+import numpy as np
 from datetime import datetime
 import plotly.express as px
 import os
 import re
+import textwrap
 import docx
 from io import BytesIO
 import time
+import hashlib
+import sqlite3
+import threading
+import logging
+import uuid
+import random
+import socket
+import unicodedata
+import zlib
+import zipfile
+from email.utils import parsedate_to_datetime
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from nexus_kb import (KNOWLEDGE_BASE_DIR, KnowledgeBaseError, load_knowledge_base, get_relevant_scenarios,
+                      get_relevant_scenarios_batch)
+
+try:
+    import fcntl  # Lock de arquivo para compartilhar o limite global entre processos (Unix)
+except ImportError:
+    fcntl = None
+
+try:
+    import tiktoken  # Contagem exata de tokens, quando instalado
+except ImportError:
+    tiktoken = None
 
 # ================= CONFIGURATION =================
 
@@ -20,6 +49,14 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Log das decisões de roteamento (custo x latência)
+logger = logging.getLogger("nexus")
+if not logger.handlers:
+    _log_handler = logging.StreamHandler()
+    _log_handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(levelname)s %(message)s"))
+    logger.addHandler(_log_handler)
+    logger.setLevel(logging.INFO)
+
 # Definindo paleta de cores
 nexus_colors = {
     "purple": "#6247AA",
@@ -98,6 +135,189 @@ PMBOK7_KNOWLEDGE_BASE = {
 TOKEN_LIMIT = 100000    # Aumentado para permitir interações mais longas
 REQUEST_LIMIT = 50      # Aumentado para permitir mais consultas por sessão
 
+# Backends de LLM (cada um com seu pool de conexões keep-alive, timeouts e limite de concorrência)
+LLM_BACKENDS = {
+    "openai": {
+        "type": "openai",
+        "base_url": "https://api.openai.com/v1",
+        "pool_size": 20,            # Conexões mantidas abertas por processo (compartilhadas por todas as sessões)
+        "connect_timeout": 5,       # Segundos para estabelecer a conexão TCP/TLS
+        "read_timeout": 60,         # Segundos aguardando dados da API
+        "max_concurrency": 16       # Chamadas simultâneas por processo
+    },
+    # Servidor local compatível com a API da OpenAI (llama.cpp, vLLM, etc.)
+    "local": {
+        "type": "openai_compatible",
+        "base_url": "http://localhost:8080/v1",
+        "pool_size": 8,
+        "connect_timeout": 2,
+        "read_timeout": 120,
+        "max_concurrency": 4
+    },
+    # Backend determinístico em processo, para testes de carga sem rede
+    "fake": {
+        "type": "fake",
+        "token_latency": 0.005,     # Segundos por token simulado
+        "max_concurrency": 64
+    }
+}
+DEFAULT_LLM_BACKEND = "openai"  # Pode ser trocado pelo segredo NEXUS_BACKEND
+
+# Exibir os tokens na área de resultado conforme são gerados (SSE)
+STREAM_RESPONSES = True
+STREAM_REFRESH_INTERVAL = 0.05  # Intervalo mínimo (s) entre atualizações da área de resultado
+STREAM_CANCEL_CHECK_INTERVAL = 0.2  # Intervalo (s) de verificação do botão Parar enquanto a API não envia nada
+
+# Gerações em segundo plano (o resultado sobrevive a reruns, downloads e recarregamentos da página)
+GENERATION_WORKERS = 8              # Gerações simultâneas por processo
+JOB_RETENTION_SECONDS = 2 * 3600    # Tempo que um resultado concluído fica disponível
+MAX_TONE_VARIANTS = 3               # Variantes de tom geradas em paralelo no modo de comparação
+
+# Novas tentativas automáticas (429, 5xx e falhas de conexão) com backoff exponencial e jitter
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+RETRY_BASE_DELAY = 1.0      # Espera base (s) da primeira nova tentativa
+RETRY_MAX_DELAY = 20.0      # Espera máxima (s) entre tentativas; Retry-After acima disso não é aguardado
+DEFAULT_MAX_RETRIES = 3
+# Orçamento de novas tentativas por funcionalidade (respostas longas toleram menos espera extra)
+MAX_RETRIES_BY_FEATURE = {
+    "Gerador de Comunicações Estruturadas": 3,
+    "Assistente de Reuniões": 3,
+    "Simplificador de Linguagem Técnica": 3,
+    "Facilitador de Feedback": 3,
+    "Detector de Riscos de Comunicação": 2,
+    "Consultor PMBOK 7": 2
+}
+
+# Cache de respostas: memória (LRU) + disco (SQLite), chaveado por modelo, temperatura e prompts
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".nexus_cache")
+RESPONSE_CACHE_DB = os.path.join(CACHE_DIR, "responses.sqlite3")
+RESPONSE_CACHE_MEMORY_ENTRIES = 500     # Entradas mantidas em memória
+RESPONSE_CACHE_DISK_ENTRIES = 10000     # Entradas mantidas em disco
+RESPONSE_CACHE_TTL = 7 * 24 * 3600      # Validade de uma resposta em cache (segundos)
+
+# Cache de quase-duplicatas (MinHash + LSH): pedidos que diferem só em pontuação, caixa ou poucas palavras
+NEAR_DUPLICATE_CACHE = True
+NEAR_DUPLICATE_THRESHOLD = 0.85     # Similaridade de Jaccard estimada mínima para oferecer a resposta salva
+NEAR_DUPLICATE_PERMUTATIONS = 64    # Tamanho da assinatura MinHash
+NEAR_DUPLICATE_BANDS = 16           # Bandas do LSH (4 linhas por banda)
+NEAR_DUPLICATE_SHINGLE_SIZE = 3     # Palavras por shingle
+NEAR_DUPLICATE_MAX_ENTRIES = 100000
+# Campos de escolha que precisam coincidir exatamente (um tom diferente não é uma quase-duplicata)
+NEAR_DUPLICATE_EXACT_FIELDS = ("tone", "duration", "relationship", "stakes", "experience_level")
+
+# Geração em lote (Batch API: preço reduzido e processamento fora do horário interativo)
+BATCH_BACKENDS = {
+    "openai": {
+        "type": "openai",
+        "base_url": "https://api.openai.com/v1",
+        "completion_window": "24h"
+    },
+    # Substituto local baseado em arquivos, para testes sem a Batch API
+    "local_file": {
+        "type": "local_file",
+        "llm_backend": "fake"
+    }
+}
+DEFAULT_BATCH_BACKEND = "openai"    # Pode ser trocado pelo segredo NEXUS_BATCH_BACKEND
+BATCH_DIR = os.path.join(CACHE_DIR, "batches")
+BATCH_MAX_REQUESTS = 1000           # Pedidos por arquivo enviado
+BATCH_REQUEST_LIMIT = 1000          # Cota de pedidos em lote por usuário (owner_key), somando todos os lotes enviados
+BATCH_TOKEN_LIMIT = 2000000         # Cota de tokens em lote por usuário (reserva no envio, consumo real quando o lote termina)
+
+# Base de conhecimento (cenários J1-J6 e bibliotecas J7-J10), lida de KNOWLEDGE_BASE_DIR.
+# Fonte remota opcional para arquivos ausentes no disco: segredo NEXUS_KB_REMOTE_URL
+# (ex.: https://raw.githubusercontent.com/aiagentnexus25/nexus-assistant/main/knowledge_base/)
+KNOWLEDGE_BASE_REMOTE_URL = None
+RELEVANT_SCENARIOS_LIMIT = 3    # Cenários de referência incluídos no prompt
+RETRIEVAL_ENGINE = "bm25"       # Busca interativa: "bm25" (índice invertido, NumPy), "tfidf" (NumPy/SciPy) ou "semantico" (vetores locais, índice em .nexus_cache/kb)
+BATCH_RETRIEVAL_ENGINE = "tfidf"    # Lotes: todos os pedidos pontuados num único produto de matrizes
+
+# Telemetria por chamada à API (arquivo JSONL somente de acréscimo, compartilhado entre processos)
+TELEMETRY_FILE = os.path.join(CACHE_DIR, "telemetry.jsonl")
+TELEMETRY_VIEW_RECORDS = 5000   # Registros mais recentes considerados na visão de percentis
+TELEMETRY_SUMMARY_TTL = 30      # Segundos em que o resumo de percentis é reaproveitado entre reruns e sessões
+TELEMETRY_READ_BLOCK = 64 * 1024    # Bytes lidos por vez ao percorrer o arquivo a partir do fim
+
+# Limite global da organização na API (todas as sessões; processos compartilham o arquivo de estado)
+GLOBAL_REQUESTS_PER_MINUTE = 500
+GLOBAL_TOKENS_PER_MINUTE = 200000
+RATE_LIMIT_STATE_FILE = os.path.join(CACHE_DIR, "rate_limit.json")
+RATE_LIMIT_MAX_WAIT = 30    # Espera máxima (s) na fila antes de rejeitar o pedido
+
+# Janela de contexto por modelo e orçamento de saída por subtipo (substitui o max_tokens fixo de 4000)
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-3.5-turbo": 16385,
+    "gpt-4o-mini": 128000,
+    "gpt-4o": 128000,
+    "gpt-4-turbo": 128000
+}
+DEFAULT_CONTEXT_WINDOW = 4096
+DEFAULT_MAX_OUTPUT_TOKENS = 1500
+MIN_OUTPUT_TOKENS = 256     # Com menos espaço que isso a resposta sairia truncada: recusar antes de chamar a API
+MAX_OUTPUT_TOKENS_BY_SUBTYPE = {
+    "E-mail Profissional": 800,
+    "Relatório de Status": 1200,
+    "Comunicado Formal": 900,
+    "Agenda de Reunião": 900,
+    "Ata/Resumo de Reunião": 1500,
+    "Follow-up de Reunião": 800,
+    "Simplificação de Documento Técnico": 1500,
+    "Adaptação para Executivos": 1000,
+    "Adaptação para Clientes": 1200,
+    "Adaptação para Equipe Técnica": 1500,
+    "Feedback de Desempenho": 1200,
+    "Feedback sobre Entregáveis": 1200,
+    "Roteiro para Conversa Difícil": 1500,
+    "Análise de E-mail": 2000,
+    "Análise de Comunicado": 2000,
+    "Análise de Proposta": 2500,
+    "Análise de Documento de Requisitos": 3000,
+    "Princípios de Gerenciamento": 1500,
+    "Domínios de Performance": 2000,
+    "Adaptação de Metodologias": 2000,
+    "Ferramentas e Técnicas": 2000,
+    "Melhores Práticas": 2000
+}
+
+# Roteamento de modelos por funcionalidade e subtipo ("default" vale para os subtipos não listados).
+# max_output_tokens ausente usa MAX_OUTPUT_TOKENS_BY_SUBTYPE; fallbacks são tentados em ordem quando
+# o modelo anterior está lento (timeout) ou limitado (429/5xx após as novas tentativas)
+DEFAULT_ROUTE = {"model": "gpt-4o-mini", "temperature": 0.7, "fallbacks": ["gpt-3.5-turbo"]}
+MODEL_ROUTES = {
+    "Gerador de Comunicações Estruturadas": {
+        "default": {"model": "gpt-4o-mini", "temperature": 0.7, "fallbacks": ["gpt-3.5-turbo"]}
+    },
+    "Assistente de Reuniões": {
+        "default": {"model": "gpt-4o-mini", "temperature": 0.5, "fallbacks": ["gpt-3.5-turbo"]}
+    },
+    "Simplificador de Linguagem Técnica": {
+        "default": {"model": "gpt-4o-mini", "temperature": 0.5, "fallbacks": ["gpt-3.5-turbo"]}
+    },
+    "Facilitador de Feedback": {
+        "default": {"model": "gpt-4o-mini", "temperature": 0.7, "fallbacks": ["gpt-3.5-turbo"]}
+    },
+    "Detector de Riscos de Comunicação": {
+        "default": {"model": "gpt-4o", "temperature": 0.3, "fallbacks": ["gpt-4o-mini", "gpt-3.5-turbo"]},
+        "Análise de E-mail": {"model": "gpt-4o-mini", "temperature": 0.3, "fallbacks": ["gpt-3.5-turbo"]}
+    },
+    "Consultor PMBOK 7": {
+        "default": {"model": "gpt-4o", "temperature": 0.5, "fallbacks": ["gpt-4o-mini"]},
+        "Princípios de Gerenciamento": {"model": "gpt-4o-mini", "temperature": 0.3, "max_output_tokens": 1000,
+                                        "fallbacks": ["gpt-3.5-turbo"]},
+        "Domínios de Performance": {"model": "gpt-4o-mini", "temperature": 0.3, "max_output_tokens": 1200,
+                                    "fallbacks": ["gpt-3.5-turbo"]}
+    }
+}
+FALLBACK_MAX_RETRIES = 1    # Novas tentativas antes de passar para o próximo modelo da rota
+
+# System prompt comum a todas as funcionalidades
+SYSTEM_PROMPT = """
+            Você é o NEXUS, um sistema de IA especializado em comunicação estratégica e gerenciamento de projetos.
+            Forneça respostas profissionais, estruturadas e detalhadas, adaptadas ao contexto específico.
+            Quando cenários de referência forem fornecidos, analise-os cuidadosamente e incorpore as estratégias
+            de comunicação mais relevantes às suas respostas.
+            """
+
 # CSS Personalizado
 st.markdown("""
 <style>
@@ -336,6 +556,28 @@ st.markdown("""
     .history-item:hover {
         box-shadow: 0 2px 8px rgba(0,0,0,0.1);
     }
+    
+    /* Estilo para cenários relevantes */
+    .scenario-card {
+        background-color: #F9F9FB;
+        border-radius: 8px;
+        padding: 12px;
+        margin-top: 8px;
+        margin-bottom: 12px;
+        border-left: 3px solid var(--teal);
+    }
+    
+    .scenario-title {
+        font-weight: 600;
+        color: var(--dark-purple);
+        font-size: 14px;
+        margin-bottom: 5px;
+    }
+    
+    .scenario-content {
+        font-size: 13px;
+        color: var(--text-secondary);
+    }
 </style>
 """, unsafe_allow_html=True)
 
@@ -405,12 +647,26 @@ if 'last_request_time' not in st.session_state:
     st.session_state.last_request_time = 0
 if 'session_id' not in st.session_state:
     st.session_state.session_id = datetime.now().strftime("%Y%m%d%H%M%S") + str(hash(datetime.now()))[:5]
+if 'owner_key' not in st.session_state:
+    # Chave durável do usuário, na URL (?dono=): ao contrário do session_id, sobrevive a recarregamentos.
+    # Dona dos jobs e dos lotes; quem não a tem na URL não reanexa nem baixa resultados alheios
+    owner_key = st.query_params.get("dono", "")
+    if not re.fullmatch(r"[0-9a-f]{32}", owner_key):
+        owner_key = uuid.uuid4().hex
+        st.query_params["dono"] = owner_key
+    st.session_state.owner_key = owner_key
 if 'current_feature' not in st.session_state:
     st.session_state.current_feature = ""
 if 'optimized_content' not in st.session_state:
     st.session_state.optimized_content = ""
 if 'previous_screen' not in st.session_state:
     st.session_state.previous_screen = None
+if 'active_job_id' not in st.session_state:
+    st.session_state.active_job_id = None
+if 'pending_jobs' not in st.session_state:
+    st.session_state.pending_jobs = []
+if 'relevant_scenarios' not in st.session_state:
+    st.session_state.relevant_scenarios = []
 
 # ================= HELPER FUNCTIONS =================
 
@@ -455,6 +711,312 @@ def enrich_pmbok_prompt(prompt, pmbok_topic):
     enhanced_prompt = prompt + additional_info
     return enhanced_prompt
 
+# Foco da adaptação no Simplificador para cada público
+SIMPLIFIER_FOCUS = {
+    "Executivos": "Impacto nos negócios e resultados de alto nível",
+    "Clientes não-técnicos": "Benefícios e funcionalidades em linguagem acessível",
+    "Equipe de Negócios": "Conexão com objetivos de negócios e processos",
+    "Equipe Técnica Junior": "Explicações técnicas mais detalhadas, mas com conceitos explicados"
+}
+
+def format_prompt_fields(fields):
+    """Bloco dinâmico do prompt: uma linha "Rótulo: valor" por campo informado pelo usuário"""
+    return "\n".join(f"{label}: {value}" for label, value in fields)
+
+# Rótulos gerados pelo NEXUS no prompt do usuário (format_prompt_fields, Detector e cenários de referência);
+# normalize_prompt remove apenas estes, nunca um "Nome:" digitado dentro de um campo
+PROMPT_LABELS = (
+    "Contexto do Projeto", "Público-alvo", "Pontos-chave", "Tom desejado", "Duração da reunião", "Participantes",
+    "Tópicos a serem abordados", "Tópicos abordados", "Decisões tomadas", "Ações acordadas", "Resultado da reunião",
+    "Itens de ação", "Conteúdo Técnico Original", "Conceitos-chave a preservar", "Situação específica",
+    "Pontos fortes a destacar", "Áreas para melhoria", "Relação com o receptor", "Importância da comunicação",
+    "Conteúdo para análise", "Dúvida Específica", "Nível de Experiência do Usuário", "Contexto Organizacional",
+    "Contexto", "Nível", "Situação", "Estratégias recomendadas"
+)
+PROMPT_LABEL_PATTERN = re.compile(
+    r"(?m)^(?:" + "|".join(re.escape(label) for label in sorted(PROMPT_LABELS, key=len, reverse=True))
+    + r"|Cenário \d+ \([^)\n]*\)):[ \t]*"
+)
+
+def build_prompt(feature, subtype, fields):
+    """Monta (instruções, prompt) de uma funcionalidade a partir dos campos do formulário
+    
+    As instruções dependem apenas da funcionalidade e do subtipo (e dos trechos do PMBOK 7), ficando
+    idênticas entre chamadas para aproveitar o cache de prefixo da API; os dados do usuário vão no prompt.
+    """
+    context = fields.get("context", "")
+    
+    if feature == "Gerador de Comunicações Estruturadas":
+        instructions = f"""
+        Gere um {subtype} com base nas informações do pedido: contexto do projeto, público-alvo, pontos-chave e tom desejado.
+        
+        Formate a saída adequadamente para um {subtype}, incluindo assunto/título e estrutura apropriada.
+        """
+        prompt = format_prompt_fields([
+            ("Contexto do Projeto", context),
+            ("Público-alvo", fields["audience"]),
+            ("Pontos-chave", fields["key_points"]),
+            ("Tom desejado", fields["tone"])
+        ])
+    
+    elif feature == "Assistente de Reuniões":
+        if subtype == "Agenda de Reunião":
+            instructions = """
+            Crie uma agenda detalhada para uma reunião com base nas informações do pedido: duração, contexto do projeto,
+            participantes e tópicos a serem abordados.
+            
+            Inclua alocação de tempo para cada item, responsáveis e objetivos claros.
+            """
+            prompt = format_prompt_fields([
+                ("Duração da reunião", f"{fields['duration']} minutos"),
+                ("Contexto do Projeto", context),
+                ("Participantes", fields["participants"]),
+                ("Tópicos a serem abordados", fields["topics"])
+            ])
+        elif subtype == "Ata/Resumo de Reunião":
+            instructions = """
+            Crie uma ata/resumo detalhado para uma reunião com base nas informações do pedido: duração, contexto do projeto,
+            participantes, tópicos abordados, decisões tomadas e ações acordadas.
+            
+            Organize por tópicos, destacando claramente decisões e próximos passos com responsáveis.
+            """
+            prompt = format_prompt_fields([
+                ("Duração da reunião", f"{fields['duration']} minutos"),
+                ("Contexto do Projeto", context),
+                ("Participantes", fields["participants"]),
+                ("Tópicos abordados", fields["topics"]),
+                ("Decisões tomadas", fields["decisions"]),
+                ("Ações acordadas", fields["actions"])
+            ])
+        else:  # Follow-up
+            instructions = """
+            Crie uma mensagem de follow-up para uma reunião com base nas informações do pedido: contexto do projeto,
+            participantes, tópicos abordados, resultado da reunião e itens de ação.
+            
+            A mensagem deve agradecer a participação, resumir os principais pontos, detalhar próximos passos
+            com responsáveis e prazos, e solicitar confirmação/feedback conforme apropriado.
+            """
+            prompt = format_prompt_fields([
+                ("Contexto do Projeto", context),
+                ("Participantes", fields["participants"]),
+                ("Tópicos abordados", fields["topics"]),
+                ("Resultado da reunião", fields["meeting_outcome"]),
+                ("Itens de ação", fields["action_items"])
+            ])
+    
+    elif feature == "Simplificador de Linguagem Técnica":
+        audience = fields["audience"]
+        instructions = f"""
+        Traduza/adapte o conteúdo técnico do pedido para um público de {audience}, considerando o contexto do projeto
+        e preservando os conceitos-chave indicados.
+        
+        Para {audience}, foque em:
+        - {SIMPLIFIER_FOCUS.get(audience, '')}
+        
+        Mantenha a precisão conceitual mesmo simplificando a linguagem.
+        Forneça uma explicação completa e detalhada, com exemplos e analogias apropriadas para o público.
+        """
+        prompt = format_prompt_fields([
+            ("Contexto do Projeto", context),
+            ("Conteúdo Técnico Original", fields["technical_content"]),
+            ("Conceitos-chave a preservar", fields["key_concepts"])
+        ])
+    
+    elif feature == "Facilitador de Feedback":
+        instructions = f"""
+        Estruture um {subtype} construtivo e eficaz com base nas informações do pedido: contexto do projeto,
+        situação específica, pontos fortes, áreas para melhoria e relação com o receptor.
+        
+        O feedback deve:
+        - Ser específico e baseado em comportamentos observáveis
+        - Equilibrar aspectos positivos e áreas de melhoria
+        - Incluir exemplos concretos
+        - Oferecer sugestões acionáveis
+        - Usar tom apropriado para a relação com o receptor
+        - Focar em crescimento e desenvolvimento, não em crítica
+        
+        Formate como um roteiro/script detalhado que o usuário pode seguir na conversa ou adaptar para uma comunicação escrita.
+        Adicione observações e dicas de comunicação não-verbal quando relevante.
+        """
+        prompt = format_prompt_fields([
+            ("Contexto do Projeto", context),
+            ("Situação específica", fields["situation"]),
+            ("Pontos fortes a destacar", fields["strengths"]),
+            ("Áreas para melhoria", fields["areas_for_improvement"]),
+            ("Relação com o receptor", fields["relationship"])
+        ])
+    
+    elif feature == "Detector de Riscos de Comunicação":
+        instructions = f"""
+        Analise o {subtype} do pedido quanto a riscos de comunicação, considerando o contexto do projeto,
+        o público-alvo e a importância da comunicação.
+        
+        Sua análise deve:
+        1. Identificar ambiguidades, informações incompletas ou confusas
+        2. Apontar possíveis mal-entendidos baseados no público-alvo
+        3. Detectar problemas de tom ou linguagem inapropriada
+        4. Identificar informações sensíveis ou potencialmente problemáticas
+        5. Sugerir reformulações específicas para cada problema identificado
+        6. Analisar a estrutura geral e propor melhorias organizacionais
+        7. Verificar se há informações críticas ausentes
+        
+        Organize sua análise em forma de tabela com colunas para: Trecho problemático, Risco potencial, Sugestão de melhoria.
+        Ao final, forneça uma avaliação geral dos riscos de comunicação (Baixo/Médio/Alto) e um resumo das principais recomendações.
+        Forneça também uma versão revisada completa do texto.
+        """
+        prompt = format_prompt_fields([
+            ("Contexto do Projeto", context),
+            ("Público-alvo", fields["audience"]),
+            ("Importância da comunicação", fields["stakes"])
+        ]) + f"\n\nConteúdo para análise:\n---\n{fields['content_to_analyze']}\n---"
+    
+    elif feature == "Consultor PMBOK 7":
+        instructions = f"""
+        Forneça uma orientação detalhada sobre o tema "{subtype}" do PMBOK 7 com base nas informações do pedido:
+        contexto do projeto, dúvida específica, nível de experiência do usuário e contexto organizacional.
+        
+        Sua resposta deve:
+        1. Explicar os conceitos relevantes do PMBOK 7 relacionados à dúvida
+        2. Fornecer orientações práticas adaptadas ao contexto específico
+        3. Apresentar exemplos concretos de aplicação
+        4. Destacar boas práticas e recomendações
+        5. Considerar o nível de experiência do usuário
+        6. Fazer conexões com outros domínios ou princípios relevantes do PMBOK 7
+        7. Incluir dicas de implementação prática
+        8. Mencionar possíveis desafios e como superá-los
+        
+        Formate a resposta de maneira estruturada, com seções claras e, se apropriado, inclua referências aos elementos específicos do PMBOK 7.
+        """
+        
+        # Trechos do PMBOK 7 fazem parte do bloco estático (dependem apenas do tema)
+        instructions = enrich_pmbok_prompt(instructions, subtype)
+        prompt = format_prompt_fields([
+            ("Contexto do Projeto", fields["project_context"]),
+            ("Dúvida Específica", fields["specific_question"]),
+            ("Nível de Experiência do Usuário", fields["experience_level"]),
+            ("Contexto Organizacional", fields["organization_context"])
+        ])
+    
+    else:
+        raise ValueError(f"Funcionalidade desconhecida: {feature}")
+    
+    return instructions, prompt
+
+@st.cache_resource
+def get_knowledge_base():
+    """Base de conhecimento carregada uma única vez por processo; todas as sessões compartilham a mesma cópia imutável"""
+    return load_knowledge_base(
+        KNOWLEDGE_BASE_DIR,
+        st.secrets.get("NEXUS_KB_REMOTE_URL", KNOWLEDGE_BASE_REMOTE_URL)
+    )
+
+def retrieve_scenarios(feature, fields):
+    """Cenários de referência para o pedido (o Consultor PMBOK 7 usa a base do PMBOK, não cenários)"""
+    if feature == "Consultor PMBOK 7":
+        return []
+    try:
+        knowledge_base = get_knowledge_base()
+    except KnowledgeBaseError:
+        return []
+    return get_relevant_scenarios(knowledge_base, fields.get("context"), fields.get("audience"),
+                                  limit=RELEVANT_SCENARIOS_LIMIT, engine=RETRIEVAL_ENGINE)
+
+def retrieve_scenarios_batch(batch_requests):
+    """retrieve_scenarios para vários pedidos (funcionalidade, campos) de uma vez"""
+    try:
+        knowledge_base = get_knowledge_base()
+    except KnowledgeBaseError:
+        return [[] for _ in batch_requests]
+    
+    wanted = [number for number, (feature, fields) in enumerate(batch_requests)
+              if feature != "Consultor PMBOK 7" and isinstance(fields, dict)]
+    found = get_relevant_scenarios_batch(
+        knowledge_base,
+        [(batch_requests[number][1].get("context"), batch_requests[number][1].get("audience")) for number in wanted],
+        limit=RELEVANT_SCENARIOS_LIMIT, engine=BATCH_RETRIEVAL_ENGINE
+    )
+    relevant = [[] for _ in batch_requests]
+    for number, scenarios in zip(wanted, found):
+        relevant[number] = scenarios
+    return relevant
+
+def enrich_prompt_with_scenarios(base_prompt, relevant_scenarios):
+    """
+    Enriquecer um prompt existente com informações dos cenários relevantes
+    (vão no bloco dinâmico, depois dos campos do pedido, pois dependem do contexto informado)
+    """
+    if not relevant_scenarios:
+        return base_prompt
+    
+    enhanced_prompt = base_prompt + "\n\n--- CENÁRIOS DE REFERÊNCIA ---\n"
+    for i, scenario_data in enumerate(relevant_scenarios, 1):
+        scenario = scenario_data["cenario"]
+        enhanced_prompt += f"\nCenário {i} ({scenario['categoria']}):\n"
+        enhanced_prompt += f"Contexto: {scenario['cenario']}\n"
+        enhanced_prompt += f"Nível: {scenario['complexidade']}\n"
+        
+        situacao = " / ".join(f"{message.get('interlocutor', '')}: {message.get('mensagem', '')}"
+                              for message in scenario["dialogo"])
+        if situacao:
+            enhanced_prompt += f"Situação: {situacao}\n"
+        
+        estrategias = list(scenario.get("tecnicas_utilizadas", ()))
+        if scenario.get("estrategia_sugerida"):
+            estrategias.insert(0, scenario["estrategia_sugerida"])
+        if estrategias:
+            enhanced_prompt += "Estratégias recomendadas:\n"
+            for estrategia in estrategias:
+                enhanced_prompt += f"- {estrategia}\n"
+    
+    enhanced_prompt += "\nUse os cenários acima como referência para criar uma comunicação mais eficaz e contextualizada, adaptando as estratégias recomendadas para o contexto específico descrito pelo usuário."
+    return enhanced_prompt
+
+def build_prompt_with_scenarios(feature, subtype, fields):
+    """build_prompt seguido dos cenários de referência; retorna (instruções, prompt, cenários)"""
+    instructions, prompt = build_prompt(feature, subtype, fields)
+    relevant_scenarios = retrieve_scenarios(feature, fields)
+    return instructions, enrich_prompt_with_scenarios(prompt, relevant_scenarios), relevant_scenarios
+
+# Nomes dos campos dos cenários exibidos na explicação do ranking
+SCENARIO_FIELD_LABELS = {
+    "cenario": "contexto",
+    "dialogo": "diálogo",
+    "estrategia_sugerida": "estratégia",
+    "tecnicas_utilizadas": "técnicas",
+    "analise_emocional": "análise emocional"
+}
+
+# Função para mostrar os cenários relevantes na interface
+def display_relevant_scenarios(relevant_scenarios):
+    """Exibe os cenários de referência usados no prompt"""
+    if not relevant_scenarios:
+        return
+    
+    with st.expander("📖 Cenários de referência relevantes", expanded=False):
+        for i, scenario_data in enumerate(relevant_scenarios, 1):
+            scenario = scenario_data["cenario"]
+            extra_info = ""
+            if scenario["dialogo"]:
+                extra_info = f"<br><strong>Situação:</strong> {scenario['dialogo'][0].get('mensagem', '')[:100]}..."
+            elif scenario.get("estrategia_sugerida"):
+                extra_info = f"<br><strong>Estratégia principal:</strong> {scenario['estrategia_sugerida']}"
+            
+            # Por que o cenário foi escolhido: score BM25 e termos do pedido encontrados em cada campo
+            matched_terms = "; ".join(f"{SCENARIO_FIELD_LABELS.get(field, field)}: {', '.join(terms)}"
+                                      for field, terms in scenario_data["termos"].items())
+            if matched_terms:
+                extra_info += f"<br><strong>Termos em comum:</strong> {matched_terms}"
+            
+            st.markdown(f"""
+            <div class="scenario-card">
+                <div class="scenario-title">Cenário {i}: {scenario['categoria']} · relevância {scenario_data['score']:.2f}</div>
+                <div class="scenario-content">
+                    <strong>Contexto:</strong> {scenario['cenario']}<br>
+                    <strong>Nível:</strong> {scenario['complexidade']}{extra_info}
+                </div>
+            </div>
+            """, unsafe_allow_html=True)
+
 # Função para exportar conteúdo como DOCX
 def export_as_docx(content, filename="documento"):
     doc = docx.Document()
@@ -486,93 +1048,2082 @@ def export_as_docx(content, filename="documento"):
     
     return buffer
 
-# Função para gerar conteúdo via API OpenAI
-def generate_content(prompt, model="gpt-3.5-turbo", temperature=0.7):
-    if not st.session_state.api_key_configured or not st.session_state.api_key:
-        return "API não configurada. Por favor, contate o administrador."
+# Sessão HTTP de um backend, reaproveitada entre reruns e entre sessões
+def create_http_session(pool_size):
+    """Cria a sessão HTTP com pool de conexões keep-alive (evita DNS/TCP/TLS a cada geração)"""
+    session = requests.Session()
     
-    # Verificar limites
-    if st.session_state.token_count >= TOKEN_LIMIT:
-        return "Você atingiu o limite de tokens para esta sessão. Por favor, tente novamente mais tarde."
+    # pool_block=True faz as requisições aguardarem uma conexão livre em vez de abrir conexões descartáveis
+    adapter = HTTPAdapter(pool_maxsize=pool_size, pool_block=True)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({
+        "Content-Type": "application/json",
+        "Connection": "keep-alive"
+    })
+    return session
+
+def get_http_pool_stats(session):
+    """Retorna o uso atual do pool de conexões HTTP de uma sessão, por host"""
+    stats = []
     
-    if st.session_state.request_count >= REQUEST_LIMIT:
-        return "Você atingiu o limite de requisições para esta sessão. Por favor, tente novamente mais tarde."
+    # O mesmo adaptador é montado para http e https; evitar contá-lo duas vezes
+    adapters = {id(adapter): adapter for adapter in session.adapters.values()}
+    for adapter in adapters.values():
+        pools = adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None or pool.pool is None:
+                continue
+            idle = sum(1 for conn in list(pool.pool.queue) if conn is not None)
+            stats.append({
+                'host': f"{pool.host}:{pool.port}",
+                'tamanho_pool': pool.pool.maxsize,
+                'em_uso': pool.pool.maxsize - pool.pool.qsize(),
+                'ociosas': idle,
+                'conexoes_criadas': pool.num_connections,
+                'requisicoes': pool.num_requests
+            })
+    return stats
+
+class ResponseCache:
+    """Cache de respostas em dois níveis: LRU em memória e SQLite em disco (sobrevive a reinícios)"""
     
-    try:
-        with st.spinner("Gerando conteúdo..."):
-            # Atualizar o timestamp da última requisição
-            st.session_state.last_request_time = time.time()
+    def __init__(self, db_path, memory_entries, disk_entries, ttl):
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self.ttl = ttl
+        self._memory = OrderedDict()  # chave -> (conteúdo, criado_em)
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, content TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._db.commit()
+    
+    @staticmethod
+    def make_key(backend, model, temperature, system_prompt, prompt):
+        """Gera a chave de conteúdo (SHA-256) de uma requisição"""
+        raw = json.dumps([backend, model, temperature, system_prompt, prompt], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    
+    def get(self, key):
+        """Retorna a resposta em cache ou None (memória primeiro, depois disco)"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if now - entry[1] <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return entry[0]
+                del self._memory[key]
             
-            # Incrementar contador de requisições
-            st.session_state.request_count += 1
+            row = self._db.execute(
+                "SELECT content, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._db.commit()
+                self.misses += 1
+                return None
             
-            # Configurar requisição direta à API
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {st.session_state.api_key}"
+            # Promover para a memória e registrar o acesso para a evicção LRU em disco
+            self._db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            self._remember(key, row[0], row[1])
+            self.disk_hits += 1
+            return row[0]
+    
+    def set(self, key, content):
+        """Armazena uma resposta nos dois níveis"""
+        now = time.time()
+        with self._lock:
+            self._remember(key, content, now)
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, content, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, content, now, now)
+            )
+            # Evicção em disco: expiradas e, acima do limite, as menos acessadas
+            self._db.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+            self._db.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.disk_entries,)
+            )
+            self._db.commit()
+    
+    def _remember(self, key, content, created_at):
+        self._memory[key] = (content, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+    
+    def stats(self):
+        """Contadores de acertos/erros e tamanho de cada nível"""
+        with self._lock:
+            disk_size = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                'acertos_memoria': self.memory_hits,
+                'acertos_disco': self.disk_hits,
+                'erros': self.misses,
+                'taxa_acerto': f"{(hits / lookups * 100) if lookups else 0:.1f}%",
+                'entradas_memoria': len(self._memory),
+                'entradas_disco': disk_size
             }
+
+@st.cache_resource
+def get_response_cache():
+    """Cache de respostas único por processo"""
+    return ResponseCache(RESPONSE_CACHE_DB, RESPONSE_CACHE_MEMORY_ENTRIES, RESPONSE_CACHE_DISK_ENTRIES, RESPONSE_CACHE_TTL)
+
+def normalize_prompt(text):
+    """Forma canônica de um prompt para comparação: sem acentos, caixa, pontuação e rótulos de campo"""
+    # Rótulos "Campo: valor" do bloco dinâmico são iguais em todos os pedidos e inflariam a similaridade
+    text = PROMPT_LABEL_PATTERN.sub(" ", text)
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return re.sub(r"[^\w]+", " ", text).split()
+
+class NearDuplicateIndex:
+    """Cache de respostas para pedidos quase idênticos: assinaturas MinHash com LSH em bandas, por escopo
+    
+    Complementa o ResponseCache (que só reconhece pedidos idênticos); funciona sem rede e fica em memória.
+    """
+    
+    def __init__(self, permutations, bands, threshold, shingle_size, max_entries):
+        # Funções de hash (a*x + b) mod p fixas: assinaturas comparáveis entre reinícios
+        rng = np.random.default_rng(20240501)
+        self._a = rng.integers(1, 1 << 31, size=permutations, dtype=np.uint64)[:, None]
+        self._b = rng.integers(0, 1 << 31, size=permutations, dtype=np.uint64)[:, None]
+        self._prime = np.uint64((1 << 61) - 1)
+        self._rows = permutations // bands
+        self.bands = bands
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # id -> (escopo, assinatura, conteúdo, chaves de banda), em ordem LRU
+        self._buckets = {}              # (escopo, banda, valores) -> ids
+        self._next_id = 0
+        self.lookups = 0
+        self.hits = 0
+    
+    def signature(self, text):
+        """Assinatura MinHash dos shingles de palavras do prompt normalizado (None se não houver texto)"""
+        words = normalize_prompt(text)
+        if not words:
+            return None
+        size = min(self.shingle_size, len(words))
+        shingles = {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+        hashes = np.fromiter((zlib.crc32(shingle.encode("utf-8")) for shingle in shingles),
+                             dtype=np.uint64, count=len(shingles))
+        return ((self._a * hashes + self._b) % self._prime).min(axis=1)
+    
+    def _band_keys(self, scope, signature):
+        return [(scope, band, signature[band * self._rows:(band + 1) * self._rows].tobytes())
+                for band in range(self.bands)]
+    
+    def get(self, scope, signature):
+        """Retorna (conteúdo, similaridade) da entrada mais parecida acima do limiar, ou None"""
+        with self._lock:
+            self.lookups += 1
+            candidates = set()
+            for key in self._band_keys(scope, signature):
+                candidates.update(self._buckets.get(key, ()))
             
-            # System prompt (versão resumida para exemplificação)
-            system_prompt = """
-            Você é o NEXUS, um sistema de IA especializado em comunicação estratégica e gerenciamento de projetos.
-            Forneça respostas profissionais, estruturadas e detalhadas, adaptadas ao contexto específico.
-            """
+            best, best_similarity = None, self.threshold
+            for entry_id in candidates:
+                similarity = float(np.mean(self._entries[entry_id][1] == signature))
+                if similarity >= best_similarity:
+                    best, best_similarity = entry_id, similarity
+            if best is None:
+                return None
             
-            # Adicionar mensagem do sistema e prompt do usuário
-            payload = {
-                "model": model,
-                "messages": [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": prompt}
-                ],
-                "temperature": temperature,
-                "max_tokens": 4000  # Aumentado para respostas mais completas
+            self.hits += 1
+            self._entries.move_to_end(best)
+            return self._entries[best][2], best_similarity
+    
+    def add(self, scope, signature, content):
+        with self._lock:
+            keys = self._band_keys(scope, signature)
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (scope, signature, content, keys)
+            for key in keys:
+                self._buckets.setdefault(key, set()).add(entry_id)
+            
+            # Descartar as entradas menos usadas recentemente
+            while len(self._entries) > self.max_entries:
+                old_id, (_, _, _, old_keys) = self._entries.popitem(last=False)
+                for key in old_keys:
+                    bucket = self._buckets[key]
+                    bucket.discard(old_id)
+                    if not bucket:
+                        del self._buckets[key]
+    
+    def stats(self):
+        with self._lock:
+            return {
+                'entradas': len(self._entries),
+                'consultas': self.lookups,
+                'acertos': self.hits,
+                'taxa_acerto': round(self.hits / self.lookups, 3) if self.lookups else 0.0,
+                'limiar': self.threshold
             }
+
+@st.cache_resource
+def get_near_duplicate_index():
+    """Índice de quase-duplicatas único por processo, compartilhado por todas as sessões"""
+    return NearDuplicateIndex(
+        NEAR_DUPLICATE_PERMUTATIONS,
+        NEAR_DUPLICATE_BANDS,
+        NEAR_DUPLICATE_THRESHOLD,
+        NEAR_DUPLICATE_SHINGLE_SIZE,
+        NEAR_DUPLICATE_MAX_ENTRIES
+    )
+
+def near_duplicate_scope(fields):
+    """Valores de campos de escolha que precisam coincidir exatamente (ex.: tom) para reaproveitar uma resposta"""
+    return tuple(sorted((name, str(fields[name])) for name in NEAR_DUPLICATE_EXACT_FIELDS if name in fields))
+
+def record_history(prompt, content, model, **extra):
+    """Adiciona uma geração ao histórico da sessão"""
+    st.session_state.history.append({
+        'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'feature': st.session_state.current_feature,
+        'input': prompt[:100] + "..." if len(prompt) > 100 else prompt,  # Resumido para economizar espaço
+        'output': content,
+        'model': model,
+        'session_id': st.session_state.session_id,
+        **extra
+    })
+
+def render_system_metrics():
+    """Exibe métricas de infraestrutura compartilhadas pelo processo"""
+    
+    with st.expander("📊 Métricas do sistema", expanded=False):
+        backends = list(get_llm_backends().values())
+        st.markdown("**Backends de LLM**")
+        if backends:
+            st.dataframe(pd.DataFrame([backend.stats() for backend in backends]), hide_index=True)
+        else:
+            st.caption("Nenhum backend utilizado ainda.")
+        
+        st.markdown("**Pool de conexões HTTP**")
+        pool_stats = [dict(backend=backend.name, **row) for backend in backends for row in backend.pool_stats()]
+        if pool_stats:
+            st.dataframe(pd.DataFrame(pool_stats), hide_index=True)
+        else:
+            st.caption("Nenhuma conexão aberta ainda.")
+        
+        st.markdown("**Base de conhecimento**")
+        try:
+            knowledge_base = get_knowledge_base()
+            st.dataframe(pd.DataFrame([knowledge_base.stats()]), hide_index=True)
+            file_duplicates = [item for item in knowledge_base.duplicates if item['nivel'] == 'arquivo']
+            if file_duplicates:
+                st.caption("Arquivos idênticos carregados uma única vez: " +
+                           ", ".join(f"{item['alias']} = {item['canonico']}" for item in file_duplicates))
+            record_duplicates = len(knowledge_base.duplicates) - len(file_duplicates)
+            if record_duplicates:
+                st.caption(f"Cenários repetidos descartados: {record_duplicates}")
+            if knowledge_base.snapshot_status:
+                st.caption(f"Carregada dos JSON ({knowledge_base.snapshot_status}); "
+                           "compile o snapshot com `python nexus_kb.py compile`")
+        except KnowledgeBaseError as e:
+            st.caption(str(e))
+        
+        st.markdown("**Cache de respostas**")
+        st.dataframe(pd.DataFrame([get_response_cache().stats()]), hide_index=True)
+        
+        st.markdown("**Cache de quase-duplicatas (MinHash/LSH)**")
+        st.dataframe(pd.DataFrame([get_near_duplicate_index().stats()]), hide_index=True)
+        
+        st.markdown("**Chamadas idênticas agrupadas (single-flight)**")
+        st.dataframe(pd.DataFrame([get_single_flight().stats()]), hide_index=True)
+        
+        st.markdown("**Limite global da API (todas as sessões)**")
+        st.dataframe(pd.DataFrame([get_rate_limiter().stats()]), hide_index=True)
+        
+        st.markdown("**Gerações em segundo plano**")
+        st.dataframe(pd.DataFrame([get_job_manager().stats()]), hide_index=True)
+        
+        st.markdown("**Latência por funcionalidade (p50/p95/p99, segundos)**")
+        latencies = get_latency_summary()
+        if not latencies.empty:
+            st.dataframe(latencies, hide_index=True)
+        else:
+            st.caption("Nenhuma chamada registrada ainda.")
+        
+        st.markdown("**Cache de prefixo da API (esta sessão)**")
+        usage = pd.DataFrame(st.session_state.usage_data)
+        if not usage.empty and 'cached_tokens' in usage:
+            prefix_cache = usage.groupby('feature')[['prompt_tokens', 'cached_tokens']].sum().reset_index()
+            prefix_cache['hit_rate'] = (prefix_cache['cached_tokens'] / prefix_cache['prompt_tokens']).round(3)
+            st.dataframe(prefix_cache, hide_index=True)
+        else:
+            st.caption("Nenhuma chamada registrada ainda.")
+
+class StreamError(Exception):
+    """A API enviou um evento de erro no meio da resposta em streaming"""
+    
+    def __init__(self, error):
+        message = error.get("message") if isinstance(error, dict) else None
+        super().__init__(message or str(error))
+        self.error = error
+
+def interrupt_response(response):
+    """Desbloqueia uma leitura da resposta em andamento em outra thread (response.close() só vale após o timeout de leitura)"""
+    sock = getattr(getattr(response.raw, "_connection", None), "sock", None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+def watch_cancel(response, cancel):
+    """Vigia o evento cancel durante a leitura do stream; retorna o evento que encerra a vigilância
+    
+    Sem isso, o cancelamento só é notado quando chega uma nova linha: com a API parada, o botão Parar
+    esperaria o timeout de leitura.
+    """
+    done = threading.Event()
+    lock = threading.Lock()
+    
+    def watch():
+        while not done.is_set():
+            if cancel.wait(STREAM_CANCEL_CHECK_INTERVAL):
+                with lock:
+                    if not done.is_set():
+                        interrupt_response(response)
+                return
+    
+    def stop():
+        with lock:
+            done.set()
+    
+    threading.Thread(target=watch, daemon=True).start()
+    return stop
+
+def read_streamed_completion(response, on_partial, cancel=None):
+    """Lê uma resposta SSE da API, repassando o texto parcial a on_partial conforme os tokens chegam
+    
+    Se o evento cancel for sinalizado, a conexão é fechada (a API deixa de gerar) e o texto recebido até ali é retornado,
+    mesmo que a API esteja parada sem enviar nada (watch_cancel).
+    Retorna (texto, uso, finish_reason). Eventos que não são JSON válido são ignorados (e registrados no log);
+    um evento com "error" interrompe a leitura com StreamError.
+    """
+    parts = []
+    usage = None
+    finish_reason = None
+    last_render = 0
+    
+    # A API envia eventos "data: {...}" em UTF-8, finalizados por "data: [DONE]"
+    response.encoding = "utf-8"
+    stop_watch = watch_cancel(response, cancel) if cancel is not None else None
+    try:
+        for line in response.iter_lines(decode_unicode=True):
+            if cancel is not None and cancel.is_set():
+                break
+            if not line or not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
             
-            # Fazer a requisição à API
-            response = requests.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers=headers,
-                data=json.dumps(payload),
-                timeout=60
-            )
+            try:
+                event = json.loads(data)
+            except json.JSONDecodeError:
+                event = None
+            if not isinstance(event, dict):
+                logger.warning("evento SSE inválido ignorado: %.200r", data)
+                continue
+            if event.get("error"):
+                response.close()
+                raise StreamError(event["error"])
+            if event.get("usage"):
+                usage = event["usage"]
+            for choice in event.get("choices", []):
+                delta = (choice.get("delta") or {}).get("content")
+                if delta:
+                    parts.append(delta)
+                if choice.get("finish_reason"):
+                    finish_reason = choice["finish_reason"]
             
-            # Processar a resposta
-            if response.status_code == 200:
-                result = response.json()
-                content = result['choices'][0]['message']['content']
+            # Limitar a frequência de montagem do texto parcial
+            now = time.time()
+            if parts and now - last_render >= STREAM_REFRESH_INTERVAL:
+                on_partial("".join(parts))
+                last_render = now
+    except requests.RequestException:
+        # Leitura interrompida pela vigilância do cancelamento: o texto recebido até ali é mantido
+        if cancel is None or not cancel.is_set():
+            raise
+    finally:
+        if stop_watch is not None:
+            stop_watch()
+    if cancel is not None and cancel.is_set():
+        response.close()
+    
+    content = "".join(parts)
+    on_partial(content)
+    return content, usage, finish_reason
+
+def cancelled_completion(payload, content, retries):
+    """Resultado de uma geração interrompida: texto parcial e uso estimado localmente (a API não informa)"""
+    usage = {
+        'prompt_tokens': count_message_tokens(payload["messages"]),
+        'completion_tokens': estimate_tokens(content) if content else 0
+    }
+    usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+    return {'status': 'cancelled', 'content': content, 'usage': usage, 'retries': retries}
+
+class SingleFlight:
+    """Agrupa chamadas idênticas em andamento: só a primeira vai à API, as demais aguardam o mesmo resultado"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = {}  # chave -> Future da chamada original
+        self.leaders = 0
+        self.followers = 0
+    
+    def do(self, key, fn):
+        """Executa fn uma única vez por chave em andamento; retorna (resultado, compartilhado)"""
+        with self._lock:
+            future = self._in_flight.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = Future()
+                self._in_flight[key] = future
+                self.leaders += 1
+            else:
+                self.followers += 1
+        
+        if not is_leader:
+            return future.result(), True
+        
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+        return result, False
+    
+    def stats(self):
+        """Chamadas originais, chamadas agrupadas e chamadas em andamento"""
+        with self._lock:
+            return {
+                'chamadas_originais': self.leaders,
+                'chamadas_agrupadas': self.followers,
+                'em_andamento': len(self._in_flight)
+            }
+
+@st.cache_resource
+def get_single_flight():
+    """Registro de chamadas em andamento único por processo"""
+    return SingleFlight()
+
+class TelemetryStore:
+    """Registro somente de acréscimo das chamadas à API (uma linha JSON por chamada)"""
+    
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    
+    def append(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            # Lock de arquivo: linhas de processos diferentes não se intercalam
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.write(line)
+                f.flush()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+    
+    def read(self, limit=None):
+        """Registros mais recentes (até limit), do mais antigo para o mais novo"""
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, "rb") as f:
+            if limit is None:
+                data = f.read()
+            else:
+                # Apenas o final do arquivo: blocos lidos de trás para frente até somar limit linhas
+                position = f.seek(0, os.SEEK_END)
+                blocks = []
+                newlines = 0
+                while position > 0 and newlines <= limit:
+                    size = min(TELEMETRY_READ_BLOCK, position)
+                    position -= size
+                    f.seek(position)
+                    blocks.append(f.read(size))
+                    newlines += blocks[-1].count(b"\n")
+                data = b"".join(reversed(blocks))
+        lines = data.decode("utf-8", errors="replace").splitlines()
+        if limit is not None:
+            # A primeira linha pode ter sido cortada no meio: fica de fora quando há linhas suficientes
+            lines = lines[-limit:]
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue    # Linha incompleta (processo interrompido durante a escrita)
+        return records
+
+@st.cache_resource
+def get_telemetry_store():
+    """Registro de telemetria único por processo"""
+    return TelemetryStore(TELEMETRY_FILE)
+
+@st.cache_data(ttl=TELEMETRY_SUMMARY_TTL, show_spinner=False)
+def get_latency_summary():
+    """Percentis dos registros mais recentes, recalculados no máximo a cada TELEMETRY_SUMMARY_TTL segundos"""
+    return summarize_latencies(get_telemetry_store().read(TELEMETRY_VIEW_RECORDS))
+
+def summarize_latencies(records):
+    """Percentis p50/p95/p99 de latência, TTFT e espera por funcionalidade (chamadas bem-sucedidas)"""
+    calls = pd.DataFrame(records)
+    if calls.empty:
+        return calls
+    calls = calls[calls['status'] == 200]
+    if calls.empty:
+        return calls
+    
+    rows = []
+    for feature, group in calls.groupby('feature'):
+        row = {'feature': feature, 'chamadas': len(group)}
+        for metric in ('latency', 'ttft', 'queue_wait'):
+            values = group[metric].dropna()
+            for q in (50, 95, 99):
+                row[f"{metric}_p{q}"] = round(float(values.quantile(q / 100)), 3) if len(values) else None
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+class RateLimitExceeded(Exception):
+    """Espera estimada na fila do limite global excede o prazo permitido"""
+    
+    def __init__(self, expected_wait):
+        super().__init__(f"espera estimada de {expected_wait:.0f}s")
+        self.expected_wait = expected_wait
+
+class GlobalRateLimiter:
+    """Token buckets globais (requisições/min e tokens/min) com fila justa entre sessões.
+    
+    O estado dos buckets fica em um arquivo protegido por flock, para que vários processos
+    do servidor compartilhem o mesmo limite da organização.
+    """
+    
+    def __init__(self, state_path, requests_per_minute, tokens_per_minute, max_wait):
+        self.state_path = state_path
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self._queues = {}   # session_id -> lista de tickets aguardando (ordem de chegada)
+        self._served = {}   # session_id -> atendimentos enquanto a sessão tem fila (rodízio)
+        self.granted = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        os.makedirs(os.path.dirname(state_path), exist_ok=True)
+    
+    def _update_state(self, fn):
+        """Lê, reabastece, altera e grava o estado compartilhado sob lock exclusivo de arquivo"""
+        with open(self.state_path, "a+") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                raw = f.read()
+                now = time.time()
+                state = json.loads(raw) if raw else {
+                    'requests': self.requests_per_minute, 'tokens': self.tokens_per_minute, 'updated_at': now
+                }
+                elapsed = max(0.0, now - state['updated_at'])
+                state['requests'] = min(self.requests_per_minute, state['requests'] + elapsed * self.requests_per_minute / 60)
+                state['tokens'] = min(self.tokens_per_minute, state['tokens'] + elapsed * self.tokens_per_minute / 60)
+                state['updated_at'] = now
                 
-                # Atualizar contadores de tokens
-                prompt_tokens = result['usage']['prompt_tokens']
-                completion_tokens = result['usage']['completion_tokens']
-                total_tokens = result['usage']['total_tokens']
-                st.session_state.token_count += total_tokens
+                result = fn(state)
                 
-                # Registrar uso
-                st.session_state.usage_data.append({
-                    'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    'feature': st.session_state.current_feature,
-                    'tokens': total_tokens,
-                    'model': model,
-                    'session_id': st.session_state.session_id
-                })
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+                f.flush()
+                return result
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+    
+    def _deficit_wait(self, state, requests_needed, tokens_needed):
+        """Segundos até os buckets acumularem a capacidade pedida"""
+        return max(
+            (requests_needed - state['requests']) * 60 / self.requests_per_minute,
+            (tokens_needed - state['tokens']) * 60 / self.tokens_per_minute,
+            0.0
+        )
+    
+    def _try_take(self, tokens):
+        def take(state):
+            wait = self._deficit_wait(state, 1, tokens)
+            if wait == 0:
+                state['requests'] -= 1
+                state['tokens'] -= tokens
+            return wait
+        return self._update_state(take)
+    
+    def _next_ticket(self):
+        """Próximo ticket a ser atendido: rodízio entre as sessões com pedidos na fila"""
+        candidates = [(self._served.get(sid, 0), queue[0][1], queue[0]) for sid, queue in self._queues.items() if queue]
+        return min(candidates, key=lambda c: (c[0], c[1]))[2] if candidates else None
+    
+    def _leave(self, session_id, ticket):
+        queue = self._queues.get(session_id, [])
+        if ticket in queue:
+            queue.remove(ticket)
+        if not queue:
+            self._queues.pop(session_id, None)
+            self._served.pop(session_id, None)
+        self._cond.notify_all()
+    
+    def acquire(self, session_id, tokens):
+        """Aguarda capacidade para uma requisição de ~tokens; retorna a reserva ou levanta RateLimitExceeded"""
+        # Um pedido maior que o bucket inteiro nunca caberia: limitar o custo à capacidade
+        tokens = min(tokens, self.tokens_per_minute)
+        start = time.time()
+        ticket = (object(), start, tokens)
+        
+        with self._cond:
+            # Rejeição antecipada: capacidade para os pedidos à frente deste no rodízio + este pedido.
+            # A cada rodada cada sessão é atendida uma vez: à frente ficam a fila da própria sessão e,
+            # de cada outra sessão, no máximo um pedido por rodada até a vez deste
+            own_queue = self._queues.get(session_id, [])
+            rounds = len(own_queue) + 1
+            ahead = own_queue + [t for sid, queue in self._queues.items() if sid != session_id for t in queue[:rounds]]
+            queued_requests = len(ahead) + 1
+            queued_tokens = sum(t[2] for t in ahead) + tokens
+            expected_wait = self._update_state(lambda state: self._deficit_wait(state, queued_requests, queued_tokens))
+            if expected_wait > self.max_wait:
+                self.rejected += 1
+                raise RateLimitExceeded(expected_wait)
+            self._queues.setdefault(session_id, []).append(ticket)
+        
+        while True:
+            with self._cond:
+                while self._next_ticket() is not ticket:
+                    if time.time() - start > self.max_wait:
+                        self._leave(session_id, ticket)
+                        self.rejected += 1
+                        raise RateLimitExceeded(time.time() - start)
+                    self._cond.wait(timeout=0.5)
+                wait = self._try_take(tokens)
+                elapsed = time.time() - start
+                if wait == 0:
+                    self._served[session_id] = self._served.get(session_id, 0) + 1
+                    self._leave(session_id, ticket)
+                    self.granted += 1
+                    self.total_wait += elapsed
+                    return {'tokens': tokens, 'wait': elapsed}
+                if elapsed + wait > self.max_wait:
+                    self._leave(session_id, ticket)
+                    self.rejected += 1
+                    raise RateLimitExceeded(elapsed + wait)
+            # Aguardar o reabastecimento mantendo a vez na fila (outros processos podem consumir antes)
+            time.sleep(min(wait, 0.5))
+    
+    def settle(self, reservation, used_tokens):
+        """Ajusta o bucket de tokens com o consumo real (devolve a sobra ou cobra o excedente)"""
+        difference = reservation['tokens'] - used_tokens
+        if difference:
+            def adjust(state):
+                state['tokens'] = min(self.tokens_per_minute, state['tokens'] + difference)
+            self._update_state(adjust)
+    
+    def stats(self):
+        """Capacidade disponível, fila e contadores de atendimento"""
+        state = self._update_state(lambda state: dict(state))
+        with self._cond:
+            return {
+                'requisicoes_disponiveis': int(state['requests']),
+                'tokens_disponiveis': int(state['tokens']),
+                'na_fila': sum(len(queue) for queue in self._queues.values()),
+                'atendidas': self.granted,
+                'rejeitadas': self.rejected,
+                'espera_media_s': round(self.total_wait / self.granted, 2) if self.granted else 0.0
+            }
+
+@st.cache_resource
+def get_rate_limiter():
+    """Limitador global único por processo (estado compartilhado entre processos via arquivo)"""
+    return GlobalRateLimiter(RATE_LIMIT_STATE_FILE, GLOBAL_REQUESTS_PER_MINUTE, GLOBAL_TOKENS_PER_MINUTE, RATE_LIMIT_MAX_WAIT)
+
+class PromptTooLong(Exception):
+    """O prompt não deixa espaço suficiente para a resposta no contexto do modelo ou na cota da sessão"""
+
+@lru_cache(maxsize=1024)
+def estimate_tokens(text):
+    """Estima localmente o número de tokens de um texto (exato com tiktoken, heurístico sem ele)"""
+    if tiktoken is not None:
+        return len(get_tokenizer().encode(text))
+    
+    # Heurística para português: palavras longas viram vários tokens, pontuação conta isolada
+    # e sequências de espaços (indentação) são agrupadas pelo tokenizador
+    tokens = 0
+    for match in re.finditer(r"\w+|[^\w\s]|\s{2,}", text):
+        piece = match.group()
+        if piece[0].isspace():
+            tokens += 1 + len(piece) // 8
+        elif piece[0].isalnum() or piece[0] == "_":
+            tokens += 1 + (len(piece) - 1) // 4
+        else:
+            tokens += 1
+    return tokens
+
+@lru_cache(maxsize=1)
+def get_tokenizer():
+    """Tokenizador dos modelos de chat da OpenAI (requer tiktoken)"""
+    return tiktoken.get_encoding("cl100k_base")
+
+def compile_prompt(text):
+    """Compacta um prompt de template: remove indentação, espaços repetidos e linhas vazias do template"""
+    lines = []
+    for line in textwrap.dedent(text).splitlines():
+        line = re.sub(r"[ \t]+", " ", line).strip()
+        
+        # Marcadores sem conteúdo (ex.: "- " de públicos não selecionados no Simplificador)
+        if re.fullmatch(r"(?:[-*•]|\d+[.)])", line):
+            continue
+        if not line and (not lines or not lines[-1]):
+            continue
+        lines.append(line)
+    return "\n".join(lines).strip()
+
+def compile_messages(system_prompt, prompt, instructions=""):
+    """Mensagens de chat com os prompts compactados e a economia estimada em tokens
+    
+    A parte estática (system prompt + instruções do subtipo) vem primeiro, na mensagem de sistema,
+    para formar um prefixo idêntico entre chamadas; os dados variáveis ficam na mensagem do usuário.
+    Apenas os templates são compactados: a mensagem do usuário segue literal (código colado mantém a
+    indentação e o Detector analisa o texto exatamente como foi informado).
+    """
+    static = "\n\n".join(compile_prompt(part) for part in (system_prompt, instructions) if part.strip())
+    messages = [
+        {"role": "system", "content": static},
+        {"role": "user", "content": prompt.strip()}
+    ]
+    saved = (estimate_tokens(system_prompt) + estimate_tokens(instructions) + estimate_tokens(prompt)
+             - sum(estimate_tokens(message["content"]) for message in messages))
+    return messages, saved
+
+def count_message_tokens(messages):
+    """Tokens de prompt de uma lista de mensagens, incluindo o overhead de formatação do chat"""
+    return sum(estimate_tokens(message["content"]) + 4 for message in messages) + 3
+
+def plan_completion_budget(messages, model, subtype, session_tokens_left, target=None):
+    """Calcula (tokens_de_prompt, max_tokens) a partir do subtipo (ou target), da janela do modelo e da cota da sessão"""
+    prompt_tokens = count_message_tokens(messages)
+    
+    # Sem tiktoken a estimativa é aproximada: reservar 10% de folga
+    margin = 0 if tiktoken is not None else prompt_tokens // 10
+    context_left = MODEL_CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW) - prompt_tokens - margin
+    available = min(context_left, session_tokens_left - prompt_tokens)
+    if available < MIN_OUTPUT_TOKENS:
+        raise PromptTooLong(
+            f"O conteúdo informado é longo demais (cerca de {prompt_tokens} tokens) "
+            f"para gerar uma resposta completa. Reduza o texto e tente novamente."
+        )
+    
+    if target is None:
+        target = MAX_OUTPUT_TOKENS_BY_SUBTYPE.get(subtype, DEFAULT_MAX_OUTPUT_TOKENS)
+    return prompt_tokens, min(target, available)
+
+def resolve_route(feature, subtype):
+    """Rota (modelo, temperatura, saída máxima e reservas) para a funcionalidade e o subtipo"""
+    routes = MODEL_ROUTES.get(feature, {})
+    return {**DEFAULT_ROUTE, **routes.get("default", {}), **routes.get(subtype, {})}
+
+def parse_retry_after(value):
+    """Converte o cabeçalho Retry-After (segundos ou data HTTP) em segundos de espera"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def retry_delay(attempt, retry_after=None):
+    """Espera antes da próxima tentativa: backoff exponencial com jitter completo, respeitando Retry-After"""
+    delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+class LLMBackend:
+    """Interface comum dos backends de LLM: chat com ou sem streaming e uso de tokens.
+    
+    chat() retorna {'status', 'content', 'usage', 'retries'} em caso de sucesso
+    ou {'status', 'error', 'retries'} quando o servidor responde com erro.
+    Com o evento cancel sinalizado, retorna {'status': 'cancelled', ...} com o texto parcial e o uso estimado.
+    """
+    
+    requires_api_key = False
+    
+    def __init__(self, name, max_concurrency):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self.calls = 0
+    
+    def chat(self, payload, api_key=None, on_partial=None, on_status=None, max_retries=DEFAULT_MAX_RETRIES,
+             cancel=None):
+        """Executa o chat respeitando o limite de concorrência do backend (streaming quando há on_partial)"""
+        with self._slots:
+            with self._lock:
+                self._in_use += 1
+                self.calls += 1
+            try:
+                return self._chat(payload, api_key, on_partial, on_status, max_retries, cancel)
+            finally:
+                with self._lock:
+                    self._in_use -= 1
+    
+    def _chat(self, payload, api_key, on_partial, on_status, max_retries, cancel):
+        raise NotImplementedError
+    
+    def stats(self):
+        """Uso das vagas de concorrência do backend"""
+        with self._lock:
+            return {
+                'backend': self.name,
+                'tipo': type(self).__name__,
+                'em_uso': self._in_use,
+                'limite': self.max_concurrency,
+                'chamadas': self.calls
+            }
+    
+    def pool_stats(self):
+        return []
+
+class OpenAICompatibleBackend(LLMBackend):
+    """Qualquer servidor com a API de chat completions da OpenAI (llama.cpp, vLLM, etc.)"""
+    
+    def __init__(self, name, base_url, pool_size, connect_timeout, read_timeout, max_concurrency, api_key=None):
+        super().__init__(name, max_concurrency)
+        self.url = base_url.rstrip("/") + "/chat/completions"
+        self.timeout = (connect_timeout, read_timeout)
+        self.api_key = api_key
+        self.http_session = create_http_session(pool_size)
+    
+    def _chat(self, payload, api_key, on_partial, on_status, max_retries, cancel):
+        # Configurar requisição à API (Content-Type já definido na sessão compartilhada)
+        headers = {}
+        # Chave recebida apenas em backends que a exigem (OpenAI); os demais usam só a chave da própria configuração
+        api_key = (api_key or self.api_key) if self.requires_api_key else self.api_key
+        if api_key:
+            headers["Authorization"] = f"Bearer {api_key}"
+        
+        # Modo streaming: o texto parcial é repassado a on_partial conforme os tokens chegam
+        stream = on_partial is not None
+        if stream:
+            payload = {**payload, "stream": True, "stream_options": {"include_usage": True}}
+        
+        # Fazer a requisição reutilizando as conexões do pool; falhas transitórias são repetidas
+        attempt = 0
+        while True:
+            try:
+                response = self.http_session.post(
+                    self.url,
+                    headers=headers,
+                    data=json.dumps(payload),
+                    timeout=self.timeout,
+                    stream=stream
+                )
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= max_retries:
+                    raise
+                delay = retry_delay(attempt)
+            else:
+                if response.status_code == 200:
+                    break
                 
-                # Adicionar ao histórico
-                st.session_state.history.append({
-                    'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    'feature': st.session_state.current_feature,
-                    'input': prompt[:100] + "..." if len(prompt) > 100 else prompt,  # Resumido para economizar espaço
-                    'output': content,
-                    'model': model,
-                    'session_id': st.session_state.session_id
-                })
+                error = {'status': response.status_code, 'error': response.text, 'retries': attempt}
+                response.close()
+                if response.status_code not in RETRYABLE_STATUS_CODES or attempt >= max_retries:
+                    return error
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                if retry_after is not None and retry_after > RETRY_MAX_DELAY:
+                    # Espera pedida pela API excede o limite: devolver o erro em vez de bloquear o usuário
+                    return error
+                delay = retry_delay(attempt, retry_after)
+            
+            attempt += 1
+            if on_status is not None:
+                on_status(f"API temporariamente indisponível. Nova tentativa ({attempt}/{max_retries}) em {delay:.1f}s...")
+            if cancel is not None and cancel.wait(delay):
+                # Interrompida entre tentativas: nenhuma requisição teve sucesso, nada a cobrar
+                return {'status': 'cancelled', 'content': "", 'usage': None, 'retries': attempt}
+            elif cancel is None:
+                time.sleep(delay)
+        
+        if stream:
+            content, usage, finish_reason = read_streamed_completion(response, on_partial, cancel)
+            if cancel is not None and cancel.is_set() and usage is None:
+                return cancelled_completion(payload, content, attempt)
+            if usage is None:
+                # Servidores sem uso no stream (ex.: alguns servidores locais): estimativa local
+                usage = {
+                    'prompt_tokens': count_message_tokens(payload["messages"]),
+                    'completion_tokens': estimate_tokens(content)
+                }
+                usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+        else:
+            result = response.json()
+            content = result['choices'][0]['message']['content']
+            finish_reason = result['choices'][0].get('finish_reason')
+            usage = result['usage']
+        
+        return {'status': 200, 'content': content, 'usage': usage, 'finish_reason': finish_reason, 'retries': attempt}
+    
+    def pool_stats(self):
+        return get_http_pool_stats(self.http_session)
+
+class OpenAIBackend(OpenAICompatibleBackend):
+    """API oficial da OpenAI (autenticada com a chave configurada nos segredos)"""
+    
+    requires_api_key = True
+
+class FakeBackend(LLMBackend):
+    """Backend determinístico em processo, sem rede: a mesma entrada sempre gera a mesma saída"""
+    
+    def __init__(self, name, max_concurrency, token_latency=0.0):
+        super().__init__(name, max_concurrency)
+        self.token_latency = token_latency
+    
+    def _chat(self, payload, api_key, on_partial, on_status, max_retries, cancel):
+        messages = payload["messages"]
+        digest = hashlib.sha256(json.dumps(messages, ensure_ascii=False).encode("utf-8")).hexdigest()[:12]
+        
+        # Eco das primeiras palavras do pedido, limitado ao max_tokens solicitado
+        words = [f"**Resposta simulada ({payload['model']}, {digest})**\n\n"] + messages[-1]["content"].split()
+        limit = max(1, payload.get("max_tokens", len(words)))
+        finish_reason = "length" if len(words) > limit else "stop"
+        words = words[:limit]
+        
+        parts = []
+        last_render = 0
+        for word in words:
+            if cancel is not None and cancel.is_set():
+                return cancelled_completion(payload, "".join(parts).strip(), 0)
+            parts.append(word if word.endswith("\n") else word + " ")
+            if self.token_latency:
+                time.sleep(self.token_latency)
+            now = time.time()
+            if on_partial is not None and now - last_render >= STREAM_REFRESH_INTERVAL:
+                on_partial("".join(parts))
+                last_render = now
+        
+        content = "".join(parts).strip()
+        if on_partial is not None:
+            on_partial(content)
+        usage = {
+            'prompt_tokens': count_message_tokens(messages),
+            'completion_tokens': estimate_tokens(content)
+        }
+        usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+        return {'status': 200, 'content': content, 'usage': usage, 'finish_reason': finish_reason, 'retries': 0}
+
+def create_llm_backend(name):
+    """Instancia o backend configurado em LLM_BACKENDS (a URL pode ser trocada pelo segredo NEXUS_<NOME>_BASE_URL)"""
+    config = LLM_BACKENDS[name]
+    if config["type"] == "fake":
+        return FakeBackend(name, config["max_concurrency"], config.get("token_latency", 0.0))
+    
+    backend_class = OpenAIBackend if config["type"] == "openai" else OpenAICompatibleBackend
+    return backend_class(
+        name,
+        st.secrets.get(f"NEXUS_{name.upper()}_BASE_URL", config["base_url"]),
+        config["pool_size"],
+        config["connect_timeout"],
+        config["read_timeout"],
+        config["max_concurrency"],
+        api_key=config.get("api_key")
+    )
+
+@st.cache_resource
+def get_llm_backends():
+    """Backends instanciados, únicos por processo e compartilhados por todas as sessões"""
+    return {}
+
+def get_llm_backend(name=None):
+    """Retorna o backend pedido (por padrão o do segredo NEXUS_BACKEND), criando-o na primeira utilização"""
+    name = name or st.secrets.get("NEXUS_BACKEND", DEFAULT_LLM_BACKEND)
+    backends = get_llm_backends()
+    if name not in backends:
+        backends.setdefault(name, create_llm_backend(name))
+    return backends[name]
+
+class GenerationJob:
+    """Geração executada em segundo plano; o resultado fica disponível pelo id entre reruns e recarregamentos"""
+    
+    # Atributo em vez de isinstance: a cada rerun o script redefine as classes, mas os jobs sobrevivem no JobManager
+    is_group = False
+    
+    def __init__(self, session_id, owner, feature, subtype, model, prompt):
+        self.id = uuid.uuid4().hex
+        self.session_id = session_id    # Sessão que enviou (e onde a vaga de requisição foi reservada)
+        self.owner = owner              # Chave durável do usuário (owner_key)
+        self.feature = feature
+        self.subtype = subtype
+        self.model = model
+        self.prompt = prompt
+        self.status = "queued"
+        self.partial = ""       # Texto recebido até agora (streaming)
+        self.note = ""          # Mensagem de andamento (ex.: nova tentativa)
+        self.result = None
+        self.error = False
+        self.usage = None
+        self.cached = False     # Resposta veio do cache
+        self.shared = False     # Resposta veio de uma chamada idêntica em andamento
+        self.upstream = False   # Houve chamada própria à API (conta como requisição)
+        self.similarity = None  # Similaridade com o pedido quase idêntico cuja resposta foi reaproveitada
+        self.instructions = ""
+        self.scope = ()
+        self.tokens_saved = 0   # Tokens de prompt economizados pela compactação
+        self.route = None       # Modelos tentados na rota (ex.: "gpt-4o (429, 2.1s) → gpt-4o-mini (200, 5.3s)")
+        self.charged = False    # Já contabilizado na sessão
+        self.reserved = False   # Vaga de requisição reservada na sessão no envio
+        self.created_at = time.time()
+        self.started_at = None  # Início da execução em um worker (created_at -> started_at = espera na fila)
+        self.finished_at = None
+        self.telemetry = None   # Registro da chamada que produziu o resultado
+        self.cancelled = False  # Interrompida pelo usuário ("Parar"); result guarda o texto parcial
+        self.cancel_event = threading.Event()
+        self._done = threading.Event()
+    
+    @property
+    def finished(self):
+        return self._done.is_set()
+    
+    def wait(self, timeout=None):
+        """Aguarda a conclusão por até timeout segundos; retorna True se concluído"""
+        return self._done.wait(timeout)
+    
+    def cancel(self):
+        """Pede a interrupção da geração (o worker encerra o streaming e libera a vaga)"""
+        self.cancel_event.set()
+    
+    def finish(self, result, error=False, cancelled=False):
+        self.result = result
+        self.error = error
+        self.cancelled = cancelled
+        self.status = "error" if error else "cancelled" if cancelled else "done"
+        self.finished_at = time.time()
+        self._done.set()
+
+class VariantGroupJob:
+    """Variantes de um mesmo pedido geradas em paralelo (ex.: tons do Gerador), contabilizadas como uma entrada"""
+    
+    is_group = True
+    
+    def __init__(self, session_id, owner, feature, subtype, variants):
+        self.id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.owner = owner
+        self.feature = feature
+        self.subtype = subtype
+        self.variants = variants    # rótulo -> GenerationJob
+        self.charged = False
+        self.created_at = time.time()
+    
+    @property
+    def finished(self):
+        return all(job.finished for job in self.variants.values())
+    
+    @property
+    def finished_at(self):
+        return max(job.finished_at for job in self.variants.values()) if self.finished else None
+    
+    @property
+    def result(self):
+        """Variantes concatenadas, para download e histórico"""
+        return "\n\n".join(f"## {label}\n\n{job.result}" for label, job in self.variants.items())
+    
+    def cancel(self):
+        for job in self.variants.values():
+            job.cancel()
+    
+    def wait(self, timeout=None):
+        """Aguarda todas as variantes por até timeout segundos; retorna True se todas concluíram"""
+        deadline = None if timeout is None else time.time() + timeout
+        for job in self.variants.values():
+            remaining = None if deadline is None else max(0.0, deadline - time.time())
+            if not job.wait(remaining):
+                return False
+        return True
+
+class JobManager:
+    """Pool de workers e armazenamento dos jobs de geração, por id"""
+    
+    def __init__(self, max_workers, retention):
+        self.retention = retention
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="nexus-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+    
+    def add(self, job):
+        """Registra um job (já concluído ou a ser executado) e descarta os resultados expirados"""
+        now = time.time()
+        with self._lock:
+            expired = [job_id for job_id, old in self._jobs.items()
+                       if old.finished and now - old.finished_at > self.retention]
+            for job_id in expired:
+                del self._jobs[job_id]
+            self._jobs[job.id] = job
+        return job.id
+    
+    def submit(self, job, fn):
+        """Executa fn(job) em um worker e retorna o id do job"""
+        def run():
+            job.status = "running"
+            job.started_at = time.time()
+            try:
+                fn(job)
+            except Exception as e:
+                job.finish(f"Erro ao gerar conteúdo: {str(e)}", error=True)
+        
+        self.add(job)
+        self._executor.submit(run)
+        return job.id
+    
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id) if job_id else None
+    
+    def stats(self):
+        """Quantidade de jobs por situação"""
+        with self._lock:
+            counts = {'queued': 0, 'running': 0, 'done': 0, 'error': 0, 'cancelled': 0}
+            for job in self._jobs.values():
+                if not job.is_group:
+                    counts[job.status] += 1
+        return {
+            'na_fila': counts['queued'],
+            'em_execucao': counts['running'],
+            'concluidos': counts['done'],
+            'com_erro': counts['error'],
+            'interrompidos': counts['cancelled']
+        }
+
+@st.cache_resource
+def get_job_manager():
+    """Gerenciador de jobs único por processo, compartilhado por todas as sessões"""
+    return JobManager(GENERATION_WORKERS, JOB_RETENTION_SECONDS)
+
+# Função para gerar conteúdo via API OpenAI
+def generate_content(prompt, model=None, temperature=None, use_cache=None, subtype=None, instructions="",
+                     scope=(), near_duplicates=NEAR_DUPLICATE_CACHE):
+    """Enfileira a geração em um worker e retorna o id do job (erros e cache resultam em job já concluído)
+    
+    scope identifica os campos de escolha do pedido (near_duplicate_scope); near_duplicates=False
+    ignora respostas de pedidos apenas parecidos ("gerar novamente mesmo assim").
+    """
+    jobs = get_job_manager()
+    session_id = st.session_state.session_id
+    feature = st.session_state.current_feature
+    
+    # Modelo e temperatura vêm da tabela de rotas, salvo quando informados explicitamente
+    route = resolve_route(feature, subtype)
+    if model is not None:
+        route = {**route, "model": model, "fallbacks": []}
+    if temperature is not None:
+        route["temperature"] = temperature
+    model = route["model"]
+    temperature = route["temperature"]
+    job = GenerationJob(session_id, st.session_state.owner_key, feature, subtype, model, prompt)
+    job.instructions = instructions
+    job.scope = scope
+    
+    backend = get_llm_backend()
+    if backend.requires_api_key and (not st.session_state.api_key_configured or not st.session_state.api_key):
+        job.finish("API não configurada. Por favor, contate o administrador.", error=True)
+        return jobs.add(job)
+    
+    # Verificar limites
+    if st.session_state.token_count >= TOKEN_LIMIT:
+        job.finish("Você atingiu o limite de tokens para esta sessão. Por favor, tente novamente mais tarde.", error=True)
+        return jobs.add(job)
+    
+    if st.session_state.request_count >= REQUEST_LIMIT:
+        job.finish("Você atingiu o limite de requisições para esta sessão. Por favor, tente novamente mais tarde.", error=True)
+        return jobs.add(job)
+    
+    # Cache de respostas: configurações determinísticas por padrão, as demais apenas se solicitado
+    if use_cache is None:
+        use_cache = temperature == 0
+    # Templates compactados antes da chave de cache: variações de indentação do código não geram entradas distintas
+    messages, job.tokens_saved = compile_messages(SYSTEM_PROMPT, prompt, instructions)
+    request_key = ResponseCache.make_key(
+        backend.name, model, temperature, messages[0]["content"], messages[1]["content"]
+    )
+    response_cache = get_response_cache() if use_cache else None
+    if response_cache is not None:
+        cached_content = response_cache.get(request_key)
+        if cached_content is not None:
+            job.cached = True
+            job.finish(cached_content)
+            return jobs.add(job)
+    
+    # Segundo nível: resposta de um pedido quase idêntico no mesmo escopo (funcionalidade, subtipo, instruções)
+    near_index = get_near_duplicate_index() if NEAR_DUPLICATE_CACHE else None
+    signature = near_index.signature(messages[1]["content"]) if near_index is not None else None
+    if signature is not None:
+        near_scope = (backend.name, feature, subtype, hashlib.sha256(messages[0]["content"].encode("utf-8")).hexdigest(),
+                      scope)
+        # Mesma regra do cache exato: sem opt-in, configurações não determinísticas sempre geram uma resposta nova
+        match = near_index.get(near_scope, signature) if near_duplicates and use_cache else None
+        if match is not None:
+            job.cached = True
+            job.similarity = match[1]
+            job.finish(match[0])
+            return jobs.add(job)
+    
+    # Orçamento de saída de cada modelo da rota; pedidos que não cabem em nenhum são recusados sem chamar a API
+    budgets = []
+    refusal = None
+    for candidate in [model] + route["fallbacks"]:
+        try:
+            budgets.append((candidate,) + plan_completion_budget(
+                messages, candidate, subtype, TOKEN_LIMIT - st.session_state.token_count,
+                target=route.get("max_output_tokens")
+            ))
+        except PromptTooLong as e:
+            refusal = e
+    if not budgets:
+        job.finish(str(refusal), error=True)
+        return jobs.add(job)
+    
+    # Atualizar o timestamp da última requisição
+    st.session_state.last_request_time = time.time()
+    
+    # Reservar a vaga de requisição já no envio: jobs abandonados (VOLTAR, novo GERAR) também contam
+    st.session_state.request_count += 1
+    job.reserved = True
+    
+    # A chave da OpenAI da sessão nunca é enviada a outros servidores (locais ou configurados por segredo)
+    api_key = st.session_state.api_key if backend.requires_api_key else None
+    max_retries = MAX_RETRIES_BY_FEATURE.get(feature, DEFAULT_MAX_RETRIES)
+    
+    # Recursos compartilhados obtidos aqui: fora da thread do script o st.cache_resource não os encontra
+    single_flight = get_single_flight()
+    limiter = get_rate_limiter()
+    telemetry = get_telemetry_store()
+    
+    def run(job):
+        def on_partial(text):
+            job.partial = text
+        
+        def on_status(message):
+            job.note = message
+        
+        def call_upstream():
+            attempts = []
+            for index, (candidate, prompt_tokens_estimate, max_tokens) in enumerate(budgets):
+                is_last = index == len(budgets) - 1
+                if job.cancel_event.is_set():
+                    # Interrompida ainda na fila: nenhuma chamada à API
+                    return {'status': 'cancelled', 'content': "", 'usage': None, 'retries': 0,
+                            'model': candidate, 'route': None, 'telemetry': None}
+                payload = {
+                    "model": candidate,
+                    "messages": messages,
+                    "temperature": temperature,
+                    "max_tokens": max_tokens
+                }
                 
-                return content
+                record = {
+                    'ts': time.time(),
+                    'session_id': session_id,
+                    'feature': feature,
+                    'subtype': subtype,
+                    'backend': backend.name,
+                    'model': candidate,
+                    'queue_wait': round(job.started_at - job.created_at, 4) if job.started_at else None
+                }
+                first_token_at = []
+                
+                def on_first_partial(text):
+                    if text and not first_token_at:
+                        first_token_at.append(time.time())
+                    on_partial(text)
+                
+                # Reservar capacidade no limite global (prompt estimado + máximo de saída)
+                try:
+                    reservation = limiter.acquire(session_id, prompt_tokens_estimate + max_tokens)
+                except RateLimitExceeded:
+                    telemetry.append({**record, 'status': 'rate_limited',
+                                      'rate_limit_wait': round(time.time() - record['ts'], 4)})
+                    raise
+                used_tokens = 0
+                started = time.time()
+                try:
+                    upstream = backend.chat(
+                        payload, api_key,
+                        on_partial=on_first_partial if STREAM_RESPONSES else None,
+                        on_status=on_status,
+                        max_retries=max_retries if is_last else FALLBACK_MAX_RETRIES,
+                        cancel=job.cancel_event
+                    )
+                    # Interrompida: apenas o consumido até o cancelamento fica na cota global, o restante é devolvido
+                    if upstream['status'] in (200, 'cancelled') and upstream['usage'] is not None:
+                        used_tokens = upstream['usage']['total_tokens']
+                except Exception as e:
+                    upstream = {'status': 'timeout' if isinstance(e, requests.Timeout) else type(e).__name__}
+                    if not isinstance(e, requests.Timeout) or is_last:
+                        telemetry.append({**record, 'status': upstream['status'],
+                                          'latency': round(time.time() - started, 4)})
+                        raise
+                finally:
+                    limiter.settle(reservation, used_tokens)
+                
+                latency = time.time() - started
+                usage = upstream.get('usage') or {}
+                record.update(
+                    status=upstream['status'],
+                    retries=upstream.get('retries'),
+                    rate_limit_wait=round(reservation['wait'], 4),
+                    ttft=round(first_token_at[0] - started, 4) if first_token_at else None,
+                    latency=round(latency, 4),
+                    prompt_tokens=usage.get('prompt_tokens'),
+                    completion_tokens=usage.get('completion_tokens'),
+                    cached_tokens=(usage.get('prompt_tokens_details') or {}).get('cached_tokens') or 0
+                )
+                telemetry.append(record)
+                upstream['telemetry'] = record
+                attempts.append(f"{candidate} ({upstream['status']}, {latency:.1f}s)")
+                if upstream['status'] == 200 or is_last or (
+                        upstream['status'] != 'timeout' and upstream['status'] not in RETRYABLE_STATUS_CODES):
+                    logger.info(
+                        "rota feature=%r subtipo=%r backend=%s modelo=%s tentativas=[%s] tokens=%s economizados=%s",
+                        feature, subtype, backend.name, candidate, "; ".join(attempts), used_tokens,
+                        job.tokens_saved
+                    )
+                    upstream['model'] = candidate
+                    upstream['route'] = " → ".join(attempts)
+                    return upstream
+                
+                logger.warning("rota feature=%r subtipo=%r: %s lento/limitado (%s), usando o próximo modelo",
+                               feature, subtype, candidate, upstream['status'])
+                on_partial("")
+        
+        # Pedidos idênticos já em andamento (outras sessões, duplo clique) compartilham uma única chamada
+        try:
+            result, shared = single_flight.do(request_key, call_upstream)
+        except RateLimitExceeded as e:
+            job.finish(f"O NEXUS está com alta demanda no momento ({e}). Por favor, tente novamente em instantes.", error=True)
+            return
+        
+        # Apenas a chamada original conta como requisição da sessão (novas tentativas não contam)
+        job.shared = shared
+        job.upstream = not shared
+        if result['status'] == 'cancelled':
+            if shared:
+                job.finish("A geração idêntica em andamento foi interrompida. Por favor, tente novamente.", error=True)
+                return
+            # Texto parcial preservado; sem cache, pois a resposta está incompleta
+            job.upstream = result['usage'] is not None
+            job.usage = result['usage']
+            job.telemetry = result['telemetry']
+            job.finish(result['content'], cancelled=True)
+            return
+        if result['status'] != 200:
+            job.finish(f"Erro na API (Status {result['status']}): {result['error']}", error=True)
+            return
+        
+        if not shared:
+            job.usage = result['usage']
+        job.model = result['model']
+        job.route = result['route']
+        job.telemetry = result['telemetry']
+        # Resposta cortada pelo max_tokens: o limite depende da cota restante da sessão e não entra na chave,
+        # então não é reaproveitada por outros pedidos
+        truncated = result.get('finish_reason') == "length"
+        if response_cache is not None and not truncated:
+            response_cache.set(request_key, result['content'])
+        if signature is not None and not truncated:
+            near_index.add(near_scope, signature, result['content'])
+        job.finish(result['content'])
+    
+    job_id = jobs.submit(job, run)
+    track_job(job)
+    return job_id
+
+def generate_variants(feature, subtype, fields, field, values, use_cache=None):
+    """Gera uma variante por valor do campo (ex.: tom) em paralelo e retorna o id do grupo"""
+    variants = {}
+    for value in values[:MAX_TONE_VARIANTS]:
+        # O campo variado fica no bloco dinâmico: as variantes compartilham o mesmo prefixo estático
+        variant_fields = {**fields, field: value}
+        instructions, prompt, _ = build_prompt_with_scenarios(feature, subtype, variant_fields)
+        job_id = generate_content(prompt, use_cache=use_cache, subtype=subtype, instructions=instructions,
+                                  scope=near_duplicate_scope(variant_fields))
+        variants[value] = get_job_manager().get(job_id)
+    
+    group = VariantGroupJob(st.session_state.session_id, st.session_state.owner_key, feature, subtype, variants)
+    # O grupo é contabilizado como uma unidade: as variantes saem da lista de pendentes da sessão
+    st.session_state.pending_jobs = [job for job in st.session_state.pending_jobs
+                                     if job not in variants.values()]
+    track_job(group)
+    return get_job_manager().add(group)
+
+def track_job(job):
+    """Registra o job na lista da sessão de jobs ainda não contabilizados"""
+    st.session_state.pending_jobs.append(job)
+
+def account_pending_jobs():
+    """Contabiliza todos os jobs concluídos da sessão, inclusive os que não estão mais em exibição"""
+    pending = []
+    for job in st.session_state.pending_jobs:
+        if job.is_group:
+            account_variants(job)
+        else:
+            account_job(job)
+        if not job.charged:
+            pending.append(job)
+    st.session_state.pending_jobs = pending
+
+def request_count_adjustment(job):
+    """Ajuste do request_count da sessão atual por um job concluído (a vaga foi reservada na sessão que o enviou)"""
+    reserved_here = job.reserved and job.session_id == st.session_state.session_id
+    if reserved_here and not job.upstream:
+        # Sem chamada própria à API (compartilhada, interrompida na fila, etc.): a vaga reservada é devolvida
+        return -1
+    if job.upstream and not reserved_here:
+        # Reanexado após recarregar a página: a sessão nova não tinha reservado a vaga
+        return 1
+    return 0
+
+def account_job(job):
+    """Contabiliza o job concluído na sessão atual (uma única vez): contadores, uso e histórico"""
+    if job.charged or not job.finished or job.owner != st.session_state.owner_key:
+        return
+    job.charged = True
+    
+    st.session_state.request_count += request_count_adjustment(job)
+    if job.error:
+        return
+    
+    if job.cached:
+        # Resposta reaproveitada: não conta como requisição nem consome tokens da sessão
+        record_history(job.prompt, job.result, job.model, cached=True)
+        if job.similarity is None:
+            st.toast("♻️ Resposta recuperada do cache, sem consumo de tokens.")
+        return
+    if job.shared:
+        record_history(job.prompt, job.result, job.model, shared=True)
+        return
+    if job.usage is None:
+        # Interrompida antes de chegar à API
+        return
+    
+    # Atualizar contadores de tokens
+    prompt_tokens = job.usage['prompt_tokens']
+    completion_tokens = job.usage['completion_tokens']
+    # Tokens de prompt servidos pelo cache de prefixo da API (ausente em servidores sem esse recurso)
+    cached_tokens = (job.usage.get('prompt_tokens_details') or {}).get('cached_tokens') or 0
+    total_tokens = job.usage['total_tokens']
+    st.session_state.token_count += total_tokens
+    
+    # Registrar uso
+    telemetry = job.telemetry or {}
+    st.session_state.usage_data.append({
+        'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3],
+        'feature': job.feature,
+        'subtype': job.subtype,
+        'tokens': total_tokens,
+        'prompt_tokens': prompt_tokens,
+        'completion_tokens': completion_tokens,
+        'cached_tokens': cached_tokens,
+        'prompt_tokens_saved': job.tokens_saved,
+        'queue_wait': telemetry.get('queue_wait'),
+        'rate_limit_wait': telemetry.get('rate_limit_wait'),
+        'ttft': telemetry.get('ttft'),
+        'latency': telemetry.get('latency'),
+        'retries': telemetry.get('retries'),
+        'status': telemetry.get('status'),
+        'backend': telemetry.get('backend'),
+        'model': job.model,
+        'route': job.route,
+        'session_id': st.session_state.session_id
+    })
+    
+    # Adicionar ao histórico (geração interrompida: o texto parcial é mantido)
+    if job.cancelled:
+        record_history(job.prompt, job.result, job.model, cancelled=True)
+    else:
+        record_history(job.prompt, job.result, job.model)
+
+def account_variants(group):
+    """Contabiliza um grupo de variantes concluído como uma única entrada de uso e de histórico"""
+    if group.charged or not group.finished or group.owner != st.session_state.owner_key:
+        return
+    group.charged = True
+    
+    jobs = list(group.variants.values())
+    for job in jobs:
+        job.charged = True
+    st.session_state.request_count += sum(request_count_adjustment(job) for job in jobs)
+    
+    # Apenas chamadas próprias consomem tokens (cache e chamadas compartilhadas não)
+    paid = [job for job in jobs if not job.error and job.usage is not None and not job.shared]
+    if paid:
+        prompt_tokens = sum(job.usage['prompt_tokens'] for job in paid)
+        completion_tokens = sum(job.usage['completion_tokens'] for job in paid)
+        cached_tokens = sum((job.usage.get('prompt_tokens_details') or {}).get('cached_tokens') or 0 for job in paid)
+        total_tokens = sum(job.usage['total_tokens'] for job in paid)
+        st.session_state.token_count += total_tokens
+        
+        st.session_state.usage_data.append({
+            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3],
+            'feature': group.feature,
+            'tokens': total_tokens,
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'cached_tokens': cached_tokens,
+            'prompt_tokens_saved': sum(job.tokens_saved for job in paid),
+            'model': ", ".join(sorted({job.model for job in paid})),
+            'route': "; ".join(f"{label}: {job.route}" for label, job in group.variants.items() if job in paid),
+            'variants': len(jobs),
+            'session_id': st.session_state.session_id
+        })
+    
+    if any(not job.error for job in jobs):
+        record_history(
+            jobs[0].prompt, group.result, ", ".join(sorted({job.model for job in jobs})),
+            variants=list(group.variants)
+        )
+
+def reattach_job_from_url():
+    """Após recarregar a página, reanexa a sessão ao job indicado na URL (em execução ou concluído)"""
+    if st.session_state.active_job_id is not None:
+        return
+    job = get_job_manager().get(st.query_params.get("job"))
+    if job is not None and job.owner != st.session_state.owner_key:
+        # Job de outro usuário (URL compartilhada): nem o andamento nem o resultado são exibidos
+        del st.query_params["job"]
+        return
+    if job is not None:
+        st.session_state.active_job_id = job.id
+        st.session_state.current_feature = job.feature
+
+def clear_active_job():
+    st.session_state.active_job_id = None
+    if "job" in st.query_params:
+        del st.query_params["job"]
+
+def render_generation_result(current_feature):
+    """Exibe o resultado do job ativo, acompanhando o streaming enquanto ele estiver em execução"""
+    job = get_job_manager().get(st.session_state.active_job_id)
+    if job is None or job.feature != current_feature:
+        return
+    
+    # Exibir cenários relevantes (se houver)
+    display_relevant_scenarios(st.session_state.relevant_scenarios)
+    
+    st.markdown("### Resultado")
+    st.markdown('<div class="result-area">', unsafe_allow_html=True)
+    if job.is_group:
+        generated_content = render_variant_results(job)
+    else:
+        result_placeholder = st.empty()
+        
+        # Acompanhar o job; uma interação do usuário interrompe apenas a exibição, não a geração
+        if not job.finished:
+            stop_placeholder = render_stop_button(job)
+            with st.spinner("Gerando conteúdo..."):
+                while not job.wait(STREAM_REFRESH_INTERVAL):
+                    # Atualizar a cada consulta, mesmo sem texto: o clique em "Parar" só é atendido numa chamada ao Streamlit
+                    if job.partial:
+                        result_placeholder.markdown(job.partial + "▌")
+                    else:
+                        result_placeholder.caption(job_progress_note(job))
+            stop_placeholder.empty()
+        
+        account_job(job)
+        generated_content = job.result
+        result_placeholder.markdown(generated_content)
+        if job.cancelled:
+            st.warning("⏹️ Geração interrompida. O texto parcial foi mantido no histórico.")
+        
+        if job.similarity is not None:
+            st.info(f"♻️ Resposta reaproveitada de um pedido muito parecido (similaridade de {job.similarity:.0%}), "
+                    "sem consumo de tokens.")
+            if st.button("🔁 Gerar novamente mesmo assim", key="regenerate_near_duplicate"):
+                job_id = generate_content(job.prompt, use_cache=False, subtype=job.subtype,
+                                          instructions=job.instructions, scope=job.scope, near_duplicates=False)
+                st.session_state.active_job_id = job_id
+                st.query_params["job"] = job_id
+                st.experimental_rerun()
+    st.session_state.generated_content = generated_content
+    st.markdown('</div>', unsafe_allow_html=True)
+    
+    # Adicionar botão VOLTAR após exibir o resultado
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        if st.button("◀️ VOLTAR", key="back_from_result"):
+            # Manter o current_feature, apenas limpar o resultado
+            st.session_state.generated_content = ""
+            clear_active_job()
+            st.experimental_rerun()
+    
+    # Opções de download
+    col1, col2 = st.columns(2)
+    with col1:
+        # Download como texto
+        st.download_button(
+            label="📄 Baixar como TXT",
+            data=generated_content,
+            file_name=f"{current_feature.lower().replace(' ', '_')}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt",
+            mime="text/plain"
+        )
+    
+    with col2:
+        # Download como DOCX
+        docx_buffer = export_as_docx(generated_content)
+        st.download_button(
+            label="📝 Baixar como DOCX",
+            data=docx_buffer,
+            file_name=f"{current_feature.lower().replace(' ', '_')}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.docx",
+            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+        )
+    
+    # Comentando a parte de análise de tom, já que você decidiu não incluir por enquanto
+    # # Análise de Tom (para todos os tipos de conteúdo exceto PMBOK)
+    # if current_feature != "Consultor PMBOK 7":
+    #     create_tone_analysis_section(generated_content)
+
+def job_progress_note(job):
+    """Situação de um job que ainda não recebeu texto (fila de workers, limite global, primeiro token)"""
+    if job.note:
+        return job.note
+    if job.status == "queued":
+        return "Na fila para geração..."
+    return "Aguardando o início da resposta..."
+
+def render_stop_button(job):
+    """Botão "Parar" de uma geração em andamento (o clique chega no rerun seguinte); retorna o placeholder"""
+    placeholder = st.empty()
+    if placeholder.button("⏹️ Parar", key="stop_generation"):
+        job.cancel()
+    return placeholder
+
+def render_variant_results(group):
+    """Exibe as variantes lado a lado, acompanhando o streaming de cada uma; retorna o conteúdo combinado"""
+    placeholders = {}
+    for column, label in zip(st.columns(len(group.variants)), group.variants):
+        with column:
+            st.markdown(f"**{label}**")
+            placeholders[label] = st.empty()
+    
+    if not group.finished:
+        stop_placeholder = render_stop_button(group)
+        with st.spinner("Gerando variantes..."):
+            while not group.wait(STREAM_REFRESH_INTERVAL):
+                for label, job in group.variants.items():
+                    if job.finished:
+                        placeholders[label].markdown(job.result)
+                    elif job.partial:
+                        placeholders[label].markdown(job.partial + "▌")
+                    else:
+                        placeholders[label].caption(job_progress_note(job))
+        stop_placeholder.empty()
+    
+    account_variants(group)
+    for label, job in group.variants.items():
+        placeholders[label].markdown(job.result)
+    return group.result
+
+class BatchBackend:
+    """Processamento em lote: o arquivo JSONL é enviado de uma vez e os resultados são recolhidos depois"""
+    
+    def __init__(self, name):
+        self.name = name
+    
+    def submit(self, input_path):
+        """Envia o arquivo de entrada e retorna o id do lote no backend"""
+        raise NotImplementedError
+    
+    def poll(self, remote_id):
+        """Retorna (situação, linhas_de_saída); as linhas só vêm quando a situação é "completed" """
+        raise NotImplementedError
+
+class OpenAIBatchBackend(BatchBackend):
+    """Batch API da OpenAI: preço reduzido e processamento fora do horário interativo (janela de até 24h)"""
+    
+    def __init__(self, name, base_url, completion_window, api_key):
+        super().__init__(name)
+        self.base_url = base_url.rstrip("/")
+        self.completion_window = completion_window
+        self.api_key = api_key
+        # Sessão própria: o envio do arquivo é multipart, não JSON
+        self.http_session = requests.Session()
+    
+    def _request(self, method, path, **kwargs):
+        response = self.http_session.request(
+            method, self.base_url + path,
+            headers={"Authorization": f"Bearer {self.api_key}"},
+            timeout=(5, 120),
+            **kwargs
+        )
+        response.raise_for_status()
+        return response
+    
+    def submit(self, input_path):
+        with open(input_path, "rb") as f:
+            uploaded = self._request("POST", "/files", data={"purpose": "batch"},
+                                     files={"file": (os.path.basename(input_path), f)}).json()
+        batch = self._request("POST", "/batches", json={
+            "input_file_id": uploaded["id"],
+            "endpoint": "/v1/chat/completions",
+            "completion_window": self.completion_window
+        }).json()
+        return batch["id"]
+    
+    def poll(self, remote_id):
+        batch = self._request("GET", f"/batches/{remote_id}").json()
+        if batch["status"] == "completed":
+            lines = []
+            for file_id in (batch.get("output_file_id"), batch.get("error_file_id")):
+                if file_id:
+                    lines += self._request("GET", f"/files/{file_id}/content").text.splitlines()
+            return "completed", lines
+        if batch["status"] in ("failed", "expired", "cancelled"):
+            return "failed", None
+        return "in_progress", None
+
+class LocalFileBatchBackend(BatchBackend):
+    """Substituto local da Batch API: processa o JSONL em segundo plano com um backend de LLM e grava a saída em disco"""
+    
+    def __init__(self, name, llm_backend, output_dir, limiter):
+        super().__init__(name)
+        self.llm_backend = llm_backend
+        self.output_dir = output_dir
+        self.limiter = limiter
+    
+    def submit(self, input_path):
+        remote_id = f"local_{uuid.uuid4().hex}"
+        os.makedirs(self.output_dir, exist_ok=True)
+        output_path = os.path.join(self.output_dir, f"{remote_id}.jsonl")
+        threading.Thread(target=self._process, args=(input_path, output_path), daemon=True,
+                         name=f"nexus-batch-{remote_id}").start()
+        return remote_id
+    
+    def _process(self, input_path, output_path):
+        with open(input_path, encoding="utf-8") as f:
+            batch_requests = [json.loads(line) for line in f if line.strip()]
+        
+        lines = []
+        queue_id = f"lote:{os.path.splitext(os.path.basename(output_path))[0]}"
+        for request in batch_requests:
+            body = request["body"]
+            # As chamadas saem pelo mesmo backend da geração interativa: respeitam o limite global,
+            # na fila como uma sessão à parte (sem pressa, uma rejeição só adia o pedido)
+            while True:
+                try:
+                    reservation = self.limiter.acquire(queue_id, count_message_tokens(body["messages"]) + body["max_tokens"])
+                    break
+                except RateLimitExceeded:
+                    time.sleep(RETRY_MAX_DELAY)
+            used_tokens = 0
+            try:
+                result = self.llm_backend.chat(body)
+                if result['status'] == 200:
+                    used_tokens = result['usage']['total_tokens']
+            except Exception as e:
+                result = {'status': 500, 'error': str(e)}
+            finally:
+                self.limiter.settle(reservation, used_tokens)
+            
+            # Mesmo formato de saída da Batch API da OpenAI
+            if result['status'] == 200:
+                response = {"status_code": 200, "body": {
+                    "model": request["body"]["model"],
+                    "choices": [{"message": {"role": "assistant", "content": result['content']},
+                                 "finish_reason": result.get('finish_reason')}],
+                    "usage": result['usage']
+                }}
+                error = None
             else:
-                return f"Erro na API (Status {response.status_code}): {response.text}"
+                response = None
+                error = {"code": str(result['status']), "message": result['error']}
+            lines.append(json.dumps({"custom_id": request["custom_id"], "response": response, "error": error},
+                                    ensure_ascii=False))
+        
+        # Gravação atômica: o arquivo só aparece quando o lote inteiro terminou
+        with open(output_path + ".tmp", "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(output_path + ".tmp", output_path)
+    
+    def poll(self, remote_id):
+        output_path = os.path.join(self.output_dir, f"{remote_id}.jsonl")
+        if not os.path.exists(output_path):
+            return "in_progress", None
+        with open(output_path, encoding="utf-8") as f:
+            return "completed", f.read().splitlines()
+
+def create_batch_backend(name):
+    """Instancia o backend de lote configurado em BATCH_BACKENDS"""
+    config = BATCH_BACKENDS[name]
+    if config["type"] == "local_file":
+        return LocalFileBatchBackend(name, get_llm_backend(config["llm_backend"]), os.path.join(BATCH_DIR, "_local"),
+                                     get_rate_limiter())
+    return OpenAIBatchBackend(
+        name,
+        st.secrets.get(f"NEXUS_{name.upper()}_BASE_URL", config["base_url"]),
+        config["completion_window"],
+        st.secrets.get("OPENAI_API_KEY")
+    )
+
+@st.cache_resource
+def get_batch_backends():
+    """Backends de lote instanciados, únicos por processo"""
+    return {}
+
+def get_batch_backend(name=None):
+    """Retorna o backend de lote pedido (por padrão o do segredo NEXUS_BATCH_BACKEND)"""
+    name = name or st.secrets.get("NEXUS_BATCH_BACKEND", DEFAULT_BATCH_BACKEND)
+    backends = get_batch_backends()
+    if name not in backends:
+        backends.setdefault(name, create_batch_backend(name))
+    return backends[name]
+
+def build_batch_lines(items, requests_left, tokens_left):
+    """Converte pedidos {"id", "feature", "subtype", "fields"} em linhas JSONL da Batch API
+    
+    Usa os mesmos construtores de prompt, rotas e orçamento de saída da geração interativa. Cada linha
+    reserva prompt estimado + saída máxima da cota de lote da sessão (requests_left pedidos, tokens_left tokens);
+    os pedidos que não cabem viram erros. Retorna (linhas, erros, tokens_reservados).
+    """
+    lines, errors = [], []
+    seen = set()
+    reserved = 0
+    # Cenários de referência de todos os pedidos numa única busca
+    relevant = retrieve_scenarios_batch([(item.get("feature"), item.get("fields", {})) if isinstance(item, dict)
+                                         else (None, None) for item in items])
+    for number, item in enumerate(items, start=1):
+        if not isinstance(item, dict):
+            errors.append({'id': str(number), 'erro': "a linha não é um objeto JSON"})
+            continue
+        request_id = str(item.get("id") or number)
+        try:
+            if request_id in seen:
+                raise ValueError("id repetido")
+            seen.add(request_id)
+            
+            feature, subtype, fields = item["feature"], item["subtype"], item.get("fields", {})
+            if subtype not in feature_options.get(feature, {}).get("subtypes", []):
+                raise ValueError(f"funcionalidade/subtipo desconhecido: {feature} / {subtype}")
+            if not isinstance(fields, dict):
+                raise ValueError("fields deve ser um objeto JSON")
+            if len(lines) >= requests_left:
+                raise ValueError("cota de pedidos em lote da sessão esgotada")
+            instructions, prompt = build_prompt(feature, subtype, fields)
+            prompt = enrich_prompt_with_scenarios(prompt, relevant[number - 1])
+            messages, _ = compile_messages(SYSTEM_PROMPT, prompt, instructions)
+            route = resolve_route(feature, subtype)
+            
+            # Saída limitada pela janela do modelo e pelo que resta da cota de tokens em lote
+            prompt_tokens, max_tokens = plan_completion_budget(messages, route["model"], subtype, tokens_left - reserved,
+                                                               target=route.get("max_output_tokens"))
+        except (KeyError, ValueError, PromptTooLong) as e:
+            errors.append({'id': request_id, 'erro': str(e)})
+            continue
         
-    except Exception as e:
-        return f"Erro ao gerar conteúdo: {str(e)}"
+        reserved += prompt_tokens + max_tokens
+        lines.append({
+            "custom_id": request_id,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": route["model"],
+                "messages": messages,
+                "temperature": route["temperature"],
+                "max_tokens": max_tokens
+            }
+        })
+    return lines, errors, reserved
+
+def submit_batch(lines, backend, owner, reserved_tokens):
+    """Grava o JSONL de entrada, envia ao backend de lote e retorna o id local do lote (visível apenas ao dono)"""
+    batch_id = uuid.uuid4().hex
+    batch_dir = os.path.join(BATCH_DIR, batch_id)
+    os.makedirs(batch_dir, exist_ok=True)
+    input_path = os.path.join(batch_dir, "input.jsonl")
+    with open(input_path, "w", encoding="utf-8") as f:
+        for line in lines:
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+    
+    meta = {
+        'id': batch_id,
+        'backend': backend.name,
+        'remote_id': backend.submit(input_path),
+        'status': "in_progress",
+        'requests': len(lines),
+        'reserved_tokens': reserved_tokens,
+        'owner': owner,
+        'created_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+    write_batch_meta(meta)
+    return batch_id
+
+def write_batch_meta(meta):
+    path = os.path.join(BATCH_DIR, meta['id'], "meta.json")
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(path + ".tmp", path)
+
+def list_batches(owner):
+    """Lotes do usuário registrados em disco, do mais recente para o mais antigo"""
+    if not os.path.isdir(BATCH_DIR):
+        return []
+    batches = []
+    for batch_id in os.listdir(BATCH_DIR):
+        path = os.path.join(BATCH_DIR, batch_id, "meta.json")
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get('owner') == owner:
+                batches.append(meta)
+    return sorted(batches, key=lambda meta: meta['created_at'], reverse=True)
+
+def batch_usage(batches):
+    """Cota de lote consumida (pedidos, tokens): reserva dos lotes em andamento, consumo real dos concluídos"""
+    requests_used = sum(meta['requests'] for meta in batches)
+    tokens_used = sum(meta.get('tokens', meta['reserved_tokens']) for meta in batches)
+    return requests_used, tokens_used
+
+def refresh_batch(meta):
+    """Consulta o backend e, se o lote terminou, grava um TXT e um DOCX por id de pedido"""
+    if meta['status'] != "in_progress":
+        return meta
+    status, lines = get_batch_backend(meta['backend']).poll(meta['remote_id'])
+    if status == "completed":
+        output_dir = os.path.join(BATCH_DIR, meta['id'], "output")
+        os.makedirs(output_dir, exist_ok=True)
+        succeeded, failed, tokens = 0, 0, 0
+        for line in lines:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            response = record.get("response") or {}
+            filename = re.sub(r"[^\w.-]", "_", record["custom_id"])
+            if response.get("status_code") != 200:
+                failed += 1
+                with open(os.path.join(output_dir, f"{filename}.error.txt"), "w", encoding="utf-8") as f:
+                    f.write(json.dumps(record.get("error") or response, ensure_ascii=False))
+                continue
+            
+            content = response["body"]["choices"][0]["message"]["content"]
+            tokens += response["body"].get("usage", {}).get("total_tokens", 0)
+            with open(os.path.join(output_dir, f"{filename}.txt"), "w", encoding="utf-8") as f:
+                f.write(content)
+            with open(os.path.join(output_dir, f"{filename}.docx"), "wb") as f:
+                f.write(export_as_docx(content, record["custom_id"]).getvalue())
+            succeeded += 1
+        meta.update(succeeded=succeeded, failed=failed, tokens=tokens)
+    meta['status'] = status
+    write_batch_meta(meta)
+    return meta
+
+def export_batch_zip(batch_id):
+    """Arquivos de saída (TXT/DOCX por id de pedido) compactados para download"""
+    output_dir = os.path.join(BATCH_DIR, batch_id, "output")
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for filename in sorted(os.listdir(output_dir)):
+            archive.write(os.path.join(output_dir, filename), filename)
+    buffer.seek(0)
+    return buffer
+
+def render_batch_mode():
+    """Geração em lote: envio de um JSONL de pedidos e acompanhamento dos lotes"""
+    
+    with st.expander("📦 Geração em lote", expanded=False):
+        st.caption(
+            'Envie um arquivo JSONL com um pedido por linha: {"id": ..., "feature": ..., "subtype": ..., "fields": {...}}. '
+            'Os campos são os mesmos do formulário de cada funcionalidade. Os resultados ficam disponíveis quando o lote terminar.'
+        )
+        uploaded = st.file_uploader("Pedidos (JSONL)", type=["jsonl", "json"], key="batch_upload")
+        if uploaded is not None:
+            try:
+                items = [json.loads(line) for line in uploaded.getvalue().decode("utf-8").splitlines() if line.strip()]
+            except (UnicodeDecodeError, json.JSONDecodeError) as e:
+                st.error(f"Arquivo inválido: {e}")
+                items = []
+            
+            # Cota calculada dos lotes do usuário em disco: recarregar a página não a zera
+            requests_used, tokens_used = batch_usage(list_batches(st.session_state.owner_key))
+            lines, errors, reserved_tokens = build_batch_lines(
+                items[:BATCH_MAX_REQUESTS],
+                BATCH_REQUEST_LIMIT - requests_used,
+                BATCH_TOKEN_LIMIT - tokens_used
+            )
+            if len(items) > BATCH_MAX_REQUESTS:
+                st.warning(f"Apenas os primeiros {BATCH_MAX_REQUESTS} pedidos serão enviados.")
+            if errors:
+                st.dataframe(pd.DataFrame(errors), hide_index=True)
+            if lines and st.button(f"Enviar lote ({len(lines)} pedidos)", key="batch_submit"):
+                try:
+                    batch_id = submit_batch(lines, get_batch_backend(), st.session_state.owner_key, reserved_tokens)
+                    st.success(f"Lote {batch_id} enviado.")
+                except requests.RequestException as e:
+                    st.error(f"Erro ao enviar o lote: {str(e)}")
+        batches = list_batches(st.session_state.owner_key)
+        if batches and st.button("🔄 Atualizar lotes", key="batch_refresh"):
+            for meta in batches:
+                try:
+                    refresh_batch(meta)
+                except requests.RequestException as e:
+                    st.error(f"Erro ao consultar o lote {meta['id']}: {str(e)}")
+        requests_used, tokens_used = batch_usage(batches)
+        st.caption(f"Cota de lote: {requests_used}/{BATCH_REQUEST_LIMIT} pedidos, {tokens_used}/{BATCH_TOKEN_LIMIT} tokens.")
+        if not batches:
+            return
+        st.dataframe(pd.DataFrame(batches), hide_index=True)
+        
+        for meta in batches:
+            if meta['status'] == "completed":
+                st.download_button(
+                    label=f"⬇️ Resultados do lote {meta['id'][:8]} ({meta['created_at']})",
+                    data=export_batch_zip(meta['id']),
+                    file_name=f"nexus_lote_{meta['id']}.zip",
+                    mime="application/zip",
+                    key=f"batch_download_{meta['id']}"
+                )
 
   # Função para criar cartões de funcionalidades
 def create_feature_cards():
@@ -696,6 +3247,12 @@ def setup_sidebar():
 
  # Interface principal do aplicativo
 def main():
+    # Contabilizar os jobs concluídos desde o último rerun (mesmo os que deixaram de ser exibidos)
+    account_pending_jobs()
+    
+    # Reanexar a geração em andamento/concluída após recarregar a página
+    reattach_job_from_url()
+    
     # Renderizar o cabeçalho com gradiente
     header()
     
@@ -713,11 +3270,18 @@ def main():
         * Análise avançada de tom comunicacional
         """)
     
+    # Métricas de infraestrutura (pool de conexões, etc.)
+    render_system_metrics()
+    
+    # Geração em lote (relatórios e follow-ups recorrentes, sem chamadas interativas)
+    render_batch_mode()
+    
     # Botão VOLTAR quando estiver em uma funcionalidade
     if st.session_state.current_feature:
         if st.button("◀️ VOLTAR", key="back_to_home"):
             st.session_state.current_feature = ""
             st.session_state.previous_screen = None
+            clear_active_job()
             st.experimental_rerun()
     
     # Histórico de gerações recentes
@@ -770,7 +3334,8 @@ def main():
                                         placeholder="Ex: Projeto de desenvolvimento do aplicativo mobile, fase de testes")
                 
                 # Campos específicos por funcionalidade
-                prompt = ""
+                fields = {}
+                compare_tones = []
                 
                 if current_feature == "Gerador de Comunicações Estruturadas":
                     audience = st.text_input("Público-alvo", 
@@ -783,17 +3348,12 @@ def main():
                     tone = st.select_slider("Tom da Comunicação", 
                                         options=["Muito Formal", "Formal", "Neutro", "Amigável", "Casual"],
                                         value="Neutro")
+                    compare_tones = st.multiselect("Comparar variantes de tom",
+                                                options=["Muito Formal", "Formal", "Neutro", "Amigável", "Casual"],
+                                                max_selections=MAX_TONE_VARIANTS,
+                                                help="Selecione dois ou mais tons para gerar as versões em paralelo e compará-las lado a lado")
                     
-                    prompt = f"""
-                    Gere um {subtype} com base nas seguintes informações:
-                    
-                    Contexto do Projeto: {context}
-                    Público-alvo: {audience}
-                    Pontos-chave: {key_points}
-                    Tom desejado: {tone}
-                    
-                    Formate a saída adequadamente para um {subtype}, incluindo assunto/título e estrutura apropriada.
-                    """
+                    fields = dict(context=context, audience=audience, key_points=key_points, tone=tone)
                 
                 elif current_feature == "Assistente de Reuniões":
                     participants = st.text_area("Participantes", 
@@ -807,15 +3367,7 @@ def main():
                     duration = st.number_input("Duração (minutos)", min_value=15, max_value=240, value=60, step=15)
                     
                     if subtype == "Agenda de Reunião":
-                        prompt = f"""
-                        Crie uma agenda detalhada para uma reunião de {duration} minutos com base nas seguintes informações:
-                        
-                        Contexto do Projeto: {context}
-                        Participantes: {participants}
-                        Tópicos a serem abordados: {topics}
-                        
-                        Inclua alocação de tempo para cada item, responsáveis e objetivos claros.
-                        """
+                        fields = dict(context=context, participants=participants, topics=topics, duration=duration)
                     elif subtype == "Ata/Resumo de Reunião":
                         decisions = st.text_area("Decisões tomadas", 
                                             help="Liste as principais decisões tomadas durante a reunião",
@@ -826,17 +3378,8 @@ def main():
                                             height=100,
                                             placeholder="Ex: João irá corrigir o bug #123 até amanhã, Maria criará novos componentes até sexta")
                         
-                        prompt = f"""
-                        Crie uma ata/resumo detalhado para uma reunião de {duration} minutos com base nas seguintes informações:
-                        
-                        Contexto do Projeto: {context}
-                        Participantes: {participants}
-                        Tópicos abordados: {topics}
-                        Decisões tomadas: {decisions}
-                        Ações acordadas: {actions}
-                        
-                        Organize por tópicos, destacando claramente decisões e próximos passos com responsáveis.
-                        """
+                        fields = dict(context=context, participants=participants, topics=topics, duration=duration,
+                                      decisions=decisions, actions=actions)
                     else:  # Follow-up
                         meeting_outcome = st.text_area("Resultado da reunião", 
                                                 help="Resuma os principais resultados da reunião",
@@ -847,18 +3390,8 @@ def main():
                                                 height=100,
                                                 placeholder="Ex: João: revisão de código até 25/03; Maria: implementação da nova feature até 27/03")
                         
-                        prompt = f"""
-                        Crie uma mensagem de follow-up para uma reunião com base nas seguintes informações:
-                        
-                        Contexto do Projeto: {context}
-                        Participantes: {participants}
-                        Tópicos abordados: {topics}
-                        Resultado da reunião: {meeting_outcome}
-                        Itens de ação: {action_items}
-                        
-                        A mensagem deve agradecer a participação, resumir os principais pontos, detalhar próximos passos
-                        com responsáveis e prazos, e solicitar confirmação/feedback conforme apropriado.
-                        """
+                        fields = dict(context=context, participants=participants, topics=topics, duration=duration,
+                                      meeting_outcome=meeting_outcome, action_items=action_items)
                         
                 elif current_feature == "Simplificador de Linguagem Técnica":
                     technical_content = st.text_area("Conteúdo Técnico", 
@@ -871,22 +3404,8 @@ def main():
                                             help="Liste conceitos técnicos que devem ser mantidos mesmo se simplificados",
                                             placeholder="Ex: gerenciamento de estado, API, front-end")
                     
-                    prompt = f"""
-                    Traduza/adapte o seguinte conteúdo técnico para um público de {audience} com base nas seguintes informações:
-                    
-                    Contexto do Projeto: {context}
-                    Conteúdo Técnico Original: {technical_content}
-                    Conceitos-chave a preservar: {key_concepts}
-                    
-                    Para {audience}, foque em: 
-                    - {'Impacto nos negócios e resultados de alto nível' if audience == 'Executivos' else ''}
-                    - {'Benefícios e funcionalidades em linguagem acessível' if audience == 'Clientes não-técnicos' else ''}
-                    - {'Conexão com objetivos de negócios e processos' if audience == 'Equipe de Negócios' else ''}
-                    - {'Explicações técnicas mais detalhadas, mas com conceitos explicados' if audience == 'Equipe Técnica Junior' else ''}
-                    
-                    Mantenha a precisão conceitual mesmo simplificando a linguagem.
-                    Forneça uma explicação completa e detalhada, com exemplos e analogias apropriadas para o público.
-                    """
+                    fields = dict(context=context, technical_content=technical_content, audience=audience,
+                                  key_concepts=key_concepts)
                 
                 elif current_feature == "Facilitador de Feedback":
                     situation = st.text_area("Situação", 
@@ -904,26 +3423,8 @@ def main():
                     relationship = st.selectbox("Relação com o Receptor", 
                                             ["Membro da equipe direto", "Colega de mesmo nível", "Superior hierárquico", "Cliente", "Fornecedor"])
                     
-                    prompt = f"""
-                    Estruture um {subtype} construtivo e eficaz com base nas seguintes informações:
-                    
-                    Contexto do Projeto: {context}
-                    Situação específica: {situation}
-                    Pontos fortes a destacar: {strengths}
-                    Áreas para melhoria: {areas_for_improvement}
-                    Relação com o receptor: {relationship}
-                    
-                    O feedback deve:
-                    - Ser específico e baseado em comportamentos observáveis
-                    - Equilibrar aspectos positivos e áreas de melhoria
-                    - Incluir exemplos concretos
-                    - Oferecer sugestões acionáveis
-                    - Usar tom apropriado para a relação ({relationship})
-                    - Focar em crescimento e desenvolvimento, não em crítica
-                    
-                    Formate como um roteiro/script detalhado que o usuário pode seguir na conversa ou adaptar para uma comunicação escrita.
-                    Adicione observações e dicas de comunicação não-verbal quando relevante.
-                    """
+                    fields = dict(context=context, situation=situation, strengths=strengths,
+                                  areas_for_improvement=areas_for_improvement, relationship=relationship)
                 
                 elif current_feature == "Detector de Riscos de Comunicação":
                     content_to_analyze = st.text_area("Conteúdo para Análise", 
@@ -937,35 +3438,9 @@ def main():
                                             options=["Baixa", "Média", "Alta", "Crítica"],
                                             value="Média")
                     
-                    prompt = f"""
-                    Analise o seguinte {subtype} quanto a riscos de comunicação:
-                    
-                    Contexto do Projeto: {context}
-                    Público-alvo: {audience}
-                    Importância da comunicação: {stakes}
-                    
-                    Conteúdo para análise:
-                    ---
-                    {content_to_analyze}
-                    ---
-                    
-                    Sua análise deve:
-                    1. Identificar ambiguidades, informações incompletas ou confusas
-                    2. Apontar possíveis mal-entendidos baseados no público-alvo
-                    3. Detectar problemas de tom ou linguagem inapropriada
-                    4. Identificar informações sensíveis ou potencialmente problemáticas
-                    5. Sugerir reformulações específicas para cada problema identificado
-                    6. Analisar a estrutura geral e propor melhorias organizacionais
-                    7. Verificar se há informações críticas ausentes
-                    
-                    Organize sua análise em forma de tabela com colunas para: Trecho problemático, Risco potencial, Sugestão de melhoria.
-                    Ao final, forneça uma avaliação geral dos riscos de comunicação (Baixo/Médio/Alto) e um resumo das principais recomendações.
-                    Forneça também uma versão revisada completa do texto.
-                    """
+                    fields = dict(context=context, content_to_analyze=content_to_analyze, audience=audience, stakes=stakes)
                 
                 elif current_feature == "Consultor PMBOK 7":
-                    pmbok_topic = subtype  # Já definido pelo selectbox de subtypes
-                    
                     project_context = st.text_area("Contexto do Projeto", 
                                             help="Descreva brevemente o projeto ou a situação para contextualizar sua dúvida",
                                             height=100,
@@ -984,29 +3459,11 @@ def main():
                                                     help="Descreva brevemente o contexto organizacional (opcional)",
                                                     placeholder="Ex: Empresa de médio porte do setor financeiro com cultura tradicional")
                     
-                    base_prompt = f"""
-                    Forneça uma orientação detalhada sobre o tema "{pmbok_topic}" do PMBOK 7 com base nas seguintes informações:
-                    
-                    Contexto do Projeto: {project_context}
-                    Dúvida Específica: {specific_question}
-                    Nível de Experiência do Usuário: {experience_level}
-                    Contexto Organizacional: {organization_context}
-                    
-                    Sua resposta deve:
-                    1. Explicar os conceitos relevantes do PMBOK 7 relacionados à dúvida
-                    2. Fornecer orientações práticas adaptadas ao contexto específico
-                    3. Apresentar exemplos concretos de aplicação
-                    4. Destacar boas práticas e recomendações
-                    5. Considerar o nível de experiência do usuário ({experience_level})
-                    6. Fazer conexões com outros domínios ou princípios relevantes do PMBOK 7
-                    7. Incluir dicas de implementação prática
-                    8. Mencionar possíveis desafios e como superá-los
-                    
-                    Formate a resposta de maneira estruturada, com seções claras e, se apropriado, inclua referências aos elementos específicos do PMBOK 7.
-                    """
-                    
-                    # Enriquecemos o prompt com informações relevantes do PMBOK 7
-                    prompt = enrich_pmbok_prompt(base_prompt, pmbok_topic)
+                    fields = dict(project_context=project_context, specific_question=specific_question,
+                                  experience_level=experience_level, organization_context=organization_context)
+                
+                # Instruções estáveis por subtipo (prefixo cacheável) + dados do formulário
+                instructions, prompt = build_prompt(current_feature, subtype, fields)
                 
                 st.markdown('</div>', unsafe_allow_html=True)
                 
@@ -1025,60 +3482,43 @@ def main():
                 </style>
                 """, unsafe_allow_html=True)
                 
+                use_cache = st.checkbox("Reutilizar resposta salva para pedidos idênticos",
+                                        help="Evita uma nova chamada à API quando o mesmo pedido (ou um muito parecido) já foi gerado",
+                                        value=False)
+                
                 submit_button = st.form_submit_button("GERAR")
 
 # Processamento após o envio do formulário
             if submit_button:
-                if not st.session_state.api_key_configured:
+                if get_llm_backend().requires_api_key and not st.session_state.api_key_configured:
                     st.error("API não configurada. Por favor, contate o administrador.")
                 elif st.session_state.token_count >= TOKEN_LIMIT:
                     st.error(f"Você atingiu o limite de {TOKEN_LIMIT} tokens para esta sessão.")
                 elif st.session_state.request_count >= REQUEST_LIMIT:
                     st.error(f"Você atingiu o limite de {REQUEST_LIMIT} requisições para esta sessão.")
                 else:
-                    # Gerar conteúdo
-                    generated_content = generate_content(prompt, model="gpt-3.5-turbo", temperature=0.7)
-                    st.session_state.generated_content = generated_content
+                    # Cenários de referência da base de conhecimento (apenas no envio, não a cada rerun)
+                    st.session_state.relevant_scenarios = retrieve_scenarios(current_feature, fields)
+                    prompt = enrich_prompt_with_scenarios(prompt, st.session_state.relevant_scenarios)
                     
-                    # Exibir resultado
-                    st.markdown("### Resultado")
-                    st.markdown('<div class="result-area">', unsafe_allow_html=True)
-                    st.markdown(generated_content)
-                    st.markdown('</div>', unsafe_allow_html=True)
-                    
-                    # Adicionar botão VOLTAR após exibir o resultado
-                    col1, col2 = st.columns([1, 3])
-                    with col1:
-                        if st.button("◀️ VOLTAR", key="back_from_result"):
-                            # Manter o current_feature, apenas limpar o resultado
-                            st.session_state.generated_content = ""
-                            st.experimental_rerun()
-                    
-                    # Opções de download
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        # Download como texto
-                        st.download_button(
-                            label="📄 Baixar como TXT",
-                            data=generated_content,
-                            file_name=f"{current_feature.lower().replace(' ', '_')}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt",
-                            mime="text/plain"
-                        )
-                    
-                    with col2:
-                        # Download como DOCX
-                        docx_buffer = export_as_docx(generated_content)
-                        st.download_button(
-                            label="📝 Baixar como DOCX",
-                            data=docx_buffer,
-                            file_name=f"{current_feature.lower().replace(' ', '_')}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.docx",
-                            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+                    # Gerar conteúdo em segundo plano; o resultado é exibido a partir do job
+                    # Modelo e temperatura definidos pela tabela de rotas (MODEL_ROUTES)
+                    if len(compare_tones) > 1:
+                        job_id = generate_variants(current_feature, subtype, fields, "tone", compare_tones,
+                                                   use_cache=use_cache or None)
+                    else:
+                        job_id = generate_content(
+                            prompt,
+                            use_cache=use_cache or None,
+                            subtype=subtype,
+                            instructions=instructions,
+                            scope=near_duplicate_scope(fields)
                         )
-                    
-                    # Comentando a parte de análise de tom, já que você decidiu não incluir por enquanto
-                    # # Análise de Tom (para todos os tipos de conteúdo exceto PMBOK)
-                    # if current_feature != "Consultor PMBOK 7":
-                    #     create_tone_analysis_section(generated_content)
+                    st.session_state.active_job_id = job_id
+                    st.query_params["job"] = job_id
+            
+        # Resultado da geração ativa (permanece após downloads, reruns e recarregamentos)
+        render_generation_result(current_feature)
                     
                     
 # Iniciar a aplicação
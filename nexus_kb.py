@@ -0,0 +1,1404 @@
+"""Base de conhecimento do NEXUS: cenários de comunicação (J1-J6) e bibliotecas de prompts (J7-J10).
+
+Módulo sem dependência do Streamlit: o app o usa através de um cache por processo.
+"""
+
+import argparse
+import hashlib
+import heapq
+import json
+import math
+import os
+import re
+import sys
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
+
+import numpy as np
+import requests
+
+try:
+    from scipy import sparse  # Motor de busca TF-IDF vetorizado, quando instalado
+except ImportError:
+    sparse = None
+
+# Diretório distribuído com o repositório (fonte principal, funciona sem rede)
+KNOWLEDGE_BASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "knowledge_base")
+
+# Mapeamento de arquivos e suas chaves correspondentes
+SCENARIO_FILES = {
+    "J1.json": "negociacao_escopo",
+    "J2.json": "gerenciamento_expectativas",
+    "J3.json": "comunicacao_mas_noticias",
+    "J4.json": "facilitacao_decisoes",
+    "J5.json": "falhas_comunicacao",
+    "J6.json": "emocoes_fortes"
+}
+LIBRARY_FILES = {
+    "J7.json": "prompts_gerador",
+    "J8.json": "prompts_detector",
+    "J9.json": "controle_qualidade",
+    "J10.json": "prompts_adicionais"
+}
+
+# Campos obrigatórios de um cenário; registros sem eles são descartados na validação
+REQUIRED_SCENARIO_FIELDS = ("categoria", "complexidade", "cenario", "dialogo")
+
+# Campos comparados na deduplicação de registros (após normalização de texto): o que a busca e o prompt usam.
+# Registros que só diferem fora deles (nomes dos personagens, emoções, complexidade) são quase-cópias
+DEDUP_FIELDS = ("categoria", "cenario", "dialogo", "estrategia_sugerida", "tecnicas_utilizadas", "analise_emocional")
+# Numeração de template no texto do cenário ("Cenário adicional 31") também não distingue registros
+TEMPLATE_NUMBER_PATTERN = re.compile(r"\d+")
+# Campos que identificam o template de um cenário na busca: variações que só trocam as técnicas são o mesmo
+# template, e o top-k traz no máximo uma delas (escolhida entre RETRIEVAL_CANDIDATES candidatos por posição do top-k)
+TEMPLATE_FIELDS = tuple(field for field in DEDUP_FIELDS if field != "tecnicas_utilizadas")
+RETRIEVAL_CANDIDATES = 8
+
+# Busca: termos do pedido com menos caracteres que isto são ignorados (como no carregador antigo)
+MIN_KEYWORD_LENGTH = 4
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# Ranking BM25F: peso de cada campo do cenário e parâmetros usuais do BM25
+BM25_FIELD_BOOSTS = {
+    "cenario": 2.0,
+    "dialogo": 1.5,
+    "estrategia_sugerida": 1.0,
+    "tecnicas_utilizadas": 1.0,
+    "analise_emocional": 0.5
+}
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Postings e filtros: acima de 1/MERGE_DENSE_RATIO da base em posições, vetores densos em vez de ordenação/busca binária
+MERGE_DENSE_RATIO = 16
+
+# Motores de busca de cenários: "bm25" (índice invertido, pontuação NumPy) e "tfidf" (matriz esparsa
+# NumPy/SciPy, compilada no primeiro uso; sem SciPy instalado a busca usa o bm25)
+RETRIEVAL_ENGINES = ("bm25", "tfidf", "semantico")
+DEFAULT_RETRIEVAL_ENGINE = "bm25"
+
+# Busca semântica offline ("semantico"): n-gramas de caracteres com hashing + projeção aleatória,
+# sem rede nem GPU; vetores float32 com índice IVF (k-means) salvo em disco
+INDEX_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".nexus_cache", "kb")
+EMBEDDING_NGRAMS = (3, 4, 5)
+EMBEDDING_BUCKETS = 4096        # Espaço do hashing dos n-gramas (potência de 2)
+EMBEDDING_DIM = 256             # Dimensão final, após a projeção aleatória gaussiana
+EMBEDDING_SEED = 1729           # Semente fixa: a projeção é a mesma em todos os processos
+EMBEDDING_CHUNK = 65536         # Vetores por bloco no k-means (limita a matriz de similaridades)
+IVF_PROBES = 4                  # Listas IVF visitadas por busca
+IVF_ITERATIONS = 10             # Iterações do k-means que forma as listas
+IVF_TRAINING_SAMPLE = 64        # Vetores por lista usados no treino do k-means (o resto só é atribuído)
+
+# Snapshot binário da base compilada (python nexus_kb.py compile): registros normalizados, vocabulários,
+# índice invertido e vetores num único arquivo, lido por mmap; vale enquanto os hashes das fontes baterem
+SNAPSHOT_FILE = os.path.join(INDEX_CACHE_DIR, "snapshot.nkb")
+SNAPSHOT_MAGIC = b"NEXUSKB1"
+SNAPSHOT_ALIGNMENT = 64         # Alinhamento (bytes) de cada array dentro do arquivo
+
+LOAD_WORKERS = 8        # Arquivos lidos/decodificados em paralelo
+REMOTE_TIMEOUT = 10     # Timeout (s) por arquivo da fonte remota opcional
+
+class KnowledgeBaseError(Exception):
+    """Nenhum arquivo da base de conhecimento pôde ser carregado"""
+
+def freeze(value):
+    """Cópia somente leitura de um JSON decodificado (dicts viram MappingProxyType, listas viram tuplas)"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+def read_source(file_name, directory, remote_url=None):
+    """Conteúdo bruto de um arquivo: do diretório local ou, se ausente, da fonte remota; retorna (bytes, origem)"""
+    path = os.path.join(directory, file_name)
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            return f.read(), "local"
+    if not remote_url:
+        raise FileNotFoundError(path)
+    response = requests.get(remote_url.rstrip("/") + "/" + file_name, timeout=REMOTE_TIMEOUT)
+    response.raise_for_status()
+    return response.content, "remoto"
+
+def validate_scenarios(data):
+    """Cenários válidos de um arquivo J1-J6 e a lista de problemas encontrados"""
+    if not isinstance(data, list):
+        return [], ["esperada uma lista de cenários"]
+
+    valid, problems = [], []
+    for index, record in enumerate(data):
+        if not isinstance(record, dict):
+            problems.append(f"registro {index}: não é um objeto")
+            continue
+        missing = [field for field in REQUIRED_SCENARIO_FIELDS if not record.get(field)]
+        if missing:
+            problems.append(f"registro {index}: campos ausentes {', '.join(missing)}")
+            continue
+        if not isinstance(record["dialogo"], list):
+            problems.append(f"registro {index}: 'dialogo' deve ser uma lista")
+            continue
+        valid.append(record)
+    return valid, problems
+
+def validate_library(data):
+    """Biblioteca de prompts (J7-J10): objeto com versão e um bloco de conteúdo"""
+    if not isinstance(data, dict):
+        return None, ["esperado um objeto"]
+    content = {key: value for key, value in data.items() if key not in ("version", "last_updated")}
+    if not content:
+        return None, ["nenhum bloco de conteúdo"]
+    return data, []
+
+def read_file(file_name, directory, remote_url=None):
+    """Lê o conteúdo bruto de um arquivo e calcula seu hash; retorna (bytes ou None, relatório)"""
+    started = time.perf_counter()
+    report = {'arquivo': file_name, 'origem': None, 'bytes': 0, 'sha256': None, 'duplicado_de': None,
+              'registros': 0, 'problemas': []}
+    try:
+        raw, report['origem'] = read_source(file_name, directory, remote_url)
+    except (OSError, requests.RequestException) as e:
+        report['problemas'].append(str(e))
+        raw = None
+    else:
+        report['bytes'] = len(raw)
+        report['sha256'] = hashlib.sha256(raw).hexdigest()
+    report['segundos'] = round(time.perf_counter() - started, 4)
+    return raw, report
+
+def parse_file(file_name, raw, report):
+    """Decodifica e valida o conteúdo de um arquivo; retorna os dados válidos (ou None) e completa o relatório"""
+    started = time.perf_counter()
+    try:
+        data = json.loads(raw)
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        report['problemas'].append(str(e))
+        return None
+
+    if file_name in SCENARIO_FILES:
+        data, problems = validate_scenarios(data)
+        report['registros'] = len(data)
+    else:
+        data, problems = validate_library(data)
+        report['registros'] = 1 if data is not None else 0
+    report['problemas'] += problems
+    report['segundos'] = round(report['segundos'] + time.perf_counter() - started, 4)
+    return data
+
+def normalize_text(value):
+    """Texto comparável: minúsculas, sem acentos e com espaços colapsados"""
+    text = unicodedata.normalize("NFKD", str(value).lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return re.sub(r"\s+", " ", text).strip()
+
+def normalize_value(value):
+    """Normaliza recursivamente os textos de um valor JSON"""
+    if isinstance(value, dict):
+        return {normalize_text(key): normalize_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [normalize_value(item) for item in value]
+    return normalize_text(value) if isinstance(value, str) else value
+
+def record_hash(record, fields=DEDUP_FIELDS):
+    """Hash dos campos normalizados de um cenário (DEDUP_FIELDS): cópias com diferenças de caixa, acentos, espaços,
+    numeração do template ou ordem das técnicas colidem"""
+    normalized = {field: normalize_value(record.get(field)) for field in fields}
+    normalized["cenario"] = TEMPLATE_NUMBER_PATTERN.sub("#", str(normalized["cenario"]))
+    # As técnicas são um conjunto: a mesma lista em outra ordem não é outro cenário
+    if isinstance(normalized.get("tecnicas_utilizadas"), list):
+        normalized["tecnicas_utilizadas"] = sorted(normalized["tecnicas_utilizadas"], key=str)
+    return hashlib.sha1(json.dumps(normalized, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+def template_key(record):
+    """Hash do template do cenário (TEMPLATE_FIELDS): o de record_hash sem as técnicas"""
+    return record_hash(record, TEMPLATE_FIELDS)
+
+class Vocabulary:
+    """Valores distintos de uma coluna, guardados uma única vez e referenciados por código inteiro"""
+    __slots__ = ("values", "codes")
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+    def encode(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def decode(self, code):
+        return self.values[code]
+
+    def __len__(self):
+        return len(self.values)
+
+class ScenarioCodec:
+    """
+    Compila cenários em forma compacta: colunas categóricas (tipo, categoria, complexidade, papéis, emoções)
+    viram códigos inteiros, textos repetidos ficam numa única tabela e tuplas de códigos iguais são compartilhadas
+    """
+
+    COLUMNS = ("tipo", "categoria", "complexidade", "papel", "emocao", "texto")
+
+    def __init__(self):
+        self.vocabularies = {column: Vocabulary() for column in self.COLUMNS}
+        self.shapes = {}    # Tuplas de códigos já vistas (personagens, diálogo, técnicas)
+
+    def code(self, column, value):
+        return self.vocabularies[column].encode(value)
+
+    def value(self, column, code):
+        return self.vocabularies[column].decode(code)
+
+    def share(self, codes):
+        """Instância única para cada tupla de códigos"""
+        return self.shapes.setdefault(codes, codes)
+
+    def encode(self, scenario_id, tipo, record):
+        """Scenario compacto a partir de um registro JSON validado"""
+        text = lambda value: self.code("texto", str(value))
+        personagens = self.share(tuple(
+            self.share((self.code("papel", role), text(person.get("nome", "")),
+                        text(person.get("preocupacoes", "")), self.code("emocao", person.get("emocao_predominante", ""))))
+            for role, person in (record.get("personagens_envolvidos") or {}).items()
+        ))
+        dialogo = self.share(tuple(
+            self.share((self.code("papel", message.get("interlocutor", "")), text(message.get("mensagem", ""))))
+            for message in record["dialogo"]
+        ))
+        extras = {key: value for key, value in record.items() if key not in Scenario.FIELDS}
+        return Scenario(
+            self, sys.intern(scenario_id), self.code("tipo", tipo),
+            self.code("categoria", record["categoria"]), self.code("complexidade", record["complexidade"]),
+            record["cenario"], personagens, dialogo, text(record.get("analise_emocional", "")),
+            self.share(tuple(text(technique) for technique in record.get("tecnicas_utilizadas") or ())),
+            text(record.get("estrategia_sugerida", "")),
+            freeze(extras) if extras else None
+        )
+
+    def stats(self):
+        return {column: len(vocabulary) for column, vocabulary in self.vocabularies.items()}
+
+class Scenario:
+    """
+    Cenário compacto (códigos nas tabelas do ScenarioCodec). Os campos continuam acessíveis como no JSON
+    original, via scenario["campo"] ou scenario.get("campo"), decodificados sob demanda
+    """
+    __slots__ = ("codec", "id", "tipo_code", "categoria_code", "complexidade_code", "cenario",
+                 "personagens_codes", "dialogo_codes", "analise_code", "tecnicas_codes", "estrategia_code", "extras")
+
+    FIELDS = ("categoria", "complexidade", "cenario", "personagens_envolvidos", "dialogo",
+              "analise_emocional", "tecnicas_utilizadas", "estrategia_sugerida")
+
+    def __init__(self, codec, scenario_id, tipo_code, categoria_code, complexidade_code, cenario,
+                 personagens_codes, dialogo_codes, analise_code, tecnicas_codes, estrategia_code, extras):
+        self.codec = codec
+        self.id = scenario_id
+        self.tipo_code = tipo_code
+        self.categoria_code = categoria_code
+        self.complexidade_code = complexidade_code
+        self.cenario = cenario
+        self.personagens_codes = personagens_codes
+        self.dialogo_codes = dialogo_codes
+        self.analise_code = analise_code
+        self.tecnicas_codes = tecnicas_codes
+        self.estrategia_code = estrategia_code
+        self.extras = extras
+
+    @property
+    def tipo(self):
+        return self.codec.value("tipo", self.tipo_code)
+
+    @property
+    def roles(self):
+        """Papéis dos personagens envolvidos"""
+        return tuple(self.codec.value("papel", codes[0]) for codes in self.personagens_codes)
+
+    def __getitem__(self, field):
+        codec = self.codec
+        if field == "categoria":
+            return codec.value("categoria", self.categoria_code)
+        if field == "complexidade":
+            return codec.value("complexidade", self.complexidade_code)
+        if field == "cenario":
+            return self.cenario
+        if field == "personagens_envolvidos":
+            return {
+                codec.value("papel", role): {"nome": codec.value("texto", name),
+                                             "preocupacoes": codec.value("texto", concern),
+                                             "emocao_predominante": codec.value("emocao", emotion)}
+                for role, name, concern, emotion in self.personagens_codes
+            }
+        if field == "dialogo":
+            return tuple({"interlocutor": codec.value("papel", speaker), "mensagem": codec.value("texto", message)}
+                         for speaker, message in self.dialogo_codes)
+        if field == "analise_emocional":
+            return codec.value("texto", self.analise_code)
+        if field == "tecnicas_utilizadas":
+            return tuple(codec.value("texto", code) for code in self.tecnicas_codes)
+        if field == "estrategia_sugerida":
+            return codec.value("texto", self.estrategia_code)
+        if self.extras is not None and field in self.extras:
+            return self.extras[field]
+        raise KeyError(field)
+
+    def get(self, field, default=None):
+        try:
+            return self[field]
+        except KeyError:
+            return default
+
+    def to_dict(self):
+        """Registro no formato JSON original"""
+        record = {field: self[field] for field in self.FIELDS}
+        record["dialogo"] = list(record["dialogo"])
+        record["tecnicas_utilizadas"] = list(record["tecnicas_utilizadas"])
+        if self.extras is not None:
+            record.update(self.extras)
+        return record
+
+    def __repr__(self):
+        return f"Scenario({self.id!r}, {self['categoria']!r})"
+
+def deep_sizeof(value, seen=None):
+    """Bytes ocupados por um objeto e tudo o que ele referencia (cada objeto contado uma vez)"""
+    seen = set() if seen is None else seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, (dict, MappingProxyType)):
+        size += sum(deep_sizeof(key, seen) + deep_sizeof(item, seen) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in value)
+    elif hasattr(type(value), "__slots__"):
+        size += sum(deep_sizeof(getattr(value, slot), seen)
+                    for slot in type(value).__slots__ if hasattr(value, slot))
+    elif hasattr(value, "__dict__"):
+        size += deep_sizeof(vars(value), seen)
+    return size
+
+def tokenize(text):
+    """Termos normalizados (minúsculas, sem acentos) de um texto"""
+    return TOKEN_PATTERN.findall(normalize_text(text))
+
+def keywords(text):
+    """Termos de busca de um pedido: sem repetição e com pelo menos MIN_KEYWORD_LENGTH caracteres"""
+    return list(dict.fromkeys(term for term in tokenize(text or "") if len(term) >= MIN_KEYWORD_LENGTH))
+
+def union(postings):
+    """Posições em ordem crescente, sem repetição, de várias listas de postings (merge preguiçoso)"""
+    previous = None
+    for position in heapq.merge(*postings):
+        if position != previous:
+            yield position
+            previous = position
+
+def intersect(left, right):
+    """Posições presentes nos dois iteradores crescentes"""
+    a, b = next(left, None), next(right, None)
+    while a is not None and b is not None:
+        if a == b:
+            yield a
+            a, b = next(left, None), next(right, None)
+        elif a < b:
+            a = next(left, None)
+        else:
+            b = next(right, None)
+
+def expand(terms, keyword):
+    """Termos (lista ordenada) que começam com a palavra-chave ("escopo" também encontra "escopos")"""
+    start = bisect_left(terms, keyword)
+    end = bisect_left(terms, keyword + "\uffff", start)
+    return terms[start:end]
+
+class InvertedIndex:
+    """
+    Índice invertido por campo: termo -> postings (posições em KnowledgeBase.scenarios, em ordem crescente,
+    e frequência do termo no campo). Construído uma vez na carga; a busca não percorre mais os cenários
+    """
+
+    FIELDS = {
+        **{field: (lambda field: lambda scenario: scenario_text(scenario, field))(field) for field in BM25_FIELD_BOOSTS},
+        "papel": lambda scenario: " ".join(scenario.roles)
+    }
+    CONTEXT_FIELDS = ("cenario", "dialogo")     # Campos do filtro booleano de contexto (os da busca antiga)
+
+    def __init__(self, scenarios):
+        self.size = len(scenarios)
+        self.postings = {field: {} for field in self.FIELDS}
+        self.lengths = {field: array("I") for field in self.FIELDS}     # Termos por campo de cada cenário
+        for position, scenario in enumerate(scenarios):
+            for field, extract in self.FIELDS.items():
+                terms = tokenize(extract(scenario))
+                self.lengths[field].append(len(terms))
+                postings = self.postings[field]
+                for term, frequency in Counter(terms).items():
+                    if term not in postings:
+                        postings[term] = (array("I"), array("I"))
+                    postings[term][0].append(position)
+                    postings[term][1].append(frequency)
+        self.average_lengths = {field: (sum(lengths) / len(lengths) if lengths else 0.0) or 1.0
+                                for field, lengths in self.lengths.items()}
+        self.terms = {field: sorted(postings) for field, postings in self.postings.items()}
+
+        # Frequência de documento (cenários com o termo em algum campo ranqueado), usada no idf
+        ranked_terms = set().union(*(self.postings[field] for field in BM25_FIELD_BOOSTS))
+        self.ranked_terms = sorted(ranked_terms)
+        self.document_frequency = {
+            term: sum(1 for _ in union([self.postings[field][term][0] for field in BM25_FIELD_BOOSTS
+                                        if term in self.postings[field]]))
+            for term in self.ranked_terms
+        }
+
+    def matches(self, fields, field_keywords):
+        """Posições com alguma das palavras-chave em algum dos campos (todas, se não houver palavras-chave)"""
+        if not field_keywords:
+            return iter(range(self.size))
+        return union([self.postings[field][term][0] for field in fields
+                      for keyword in field_keywords for term in expand(self.terms[field], keyword)])
+
+    def contains(self, fields, field_keywords, positions):
+        """Máscara: quais das posições (NumPy) têm alguma das palavras-chave em algum dos campos (busca binária)"""
+        postings = [np.frombuffer(self.postings[field][term][0], dtype=np.uint32) for field in fields
+                    for term in dict.fromkeys(term for keyword in field_keywords
+                                              for term in expand(self.terms[field], keyword))]
+        if len(positions) * MERGE_DENSE_RATIO >= self.size:
+            # Muitas posições: máscara densa da base em vez de uma busca binária por posição
+            mask = np.zeros(self.size, dtype=bool)
+            for term_postings in postings:
+                mask[term_postings] = True
+            return mask[positions]
+        found = np.zeros(len(positions), dtype=bool)
+        for term_postings in postings:
+            index = np.minimum(np.searchsorted(term_postings, positions), len(term_postings) - 1)
+            found |= term_postings[index] == positions
+        return found
+
+    def score(self, query_keywords):
+        """Pontuação BM25F dos cenários que têm algum termo do pedido: (posições, scores), arrays NumPy
+
+        Vetorizada sobre os postings (np.frombuffer, sem cópia): o custo segue o tamanho dos postings
+        dos termos do pedido, sem laço Python por cenário
+        """
+        position_parts, score_parts = [], []
+        query_terms = dict.fromkeys(term for keyword in query_keywords for term in expand(self.ranked_terms, keyword))
+        for term in query_terms:
+            # Frequência combinada dos campos, normalizada pelo tamanho de cada campo e ponderada pelo peso do campo
+            term_positions, term_weights = [], []
+            for field, boost in BM25_FIELD_BOOSTS.items():
+                entry = self.postings[field].get(term)
+                if entry is None:
+                    continue
+                positions = np.frombuffer(entry[0], dtype=np.uint32)
+                frequencies = np.frombuffer(entry[1], dtype=np.uint32)
+                lengths = np.frombuffer(self.lengths[field], dtype=np.uint32)[positions]
+                term_positions.append(positions)
+                term_weights.append(boost * (frequencies /
+                                             (1 - BM25_B + BM25_B * lengths / self.average_lengths[field])))
+            positions, weights = merge_scores(term_positions, term_weights, self.size)
+
+            df = self.document_frequency[term]
+            idf = math.log(1 + (self.size - df + 0.5) / (df + 0.5))
+            position_parts.append(positions)
+            score_parts.append(idf * weights / (BM25_K1 + weights))
+        return merge_scores(position_parts, score_parts, self.size)
+
+    def search_many(self, queries, limit):
+        """Melhores cenários [(posição, score)] de cada pedido (contexto, público), por BM25F"""
+        results = []
+        for context, audience in queries:
+            context_keywords, audience_keywords = keywords(context), keywords(audience)
+            if not context_keywords:
+                # Sem termos de contexto não há ranking: primeiros cenários do público, na ordem dos arquivos
+                results.append([(position, 0.0) for position, _ in
+                                zip(self.matches(("papel",), audience_keywords), range(limit))])
+                continue
+            positions, scores = self.score(context_keywords)
+            if audience_keywords:
+                keep = self.contains(("papel",), audience_keywords, positions)
+                positions, scores = positions[keep], scores[keep]
+            # Top-k com argpartition; empates ficam com o cenário que aparece primeiro nos arquivos
+            results.append(top_positions(positions, scores, limit))
+        return results
+
+    def explain(self, position, query_keywords):
+        """Termos do pedido encontrados em cada campo ranqueado de um cenário"""
+        found = {}
+        for field in BM25_FIELD_BOOSTS:
+            for term in dict.fromkeys(term for keyword in query_keywords for term in expand(self.terms[field], keyword)):
+                positions = self.postings[field][term][0]
+                index = bisect_left(positions, position)
+                if index < len(positions) and positions[index] == position:
+                    found.setdefault(field, []).append(term)
+        return found
+
+    def stats(self):
+        return {field: len(postings) for field, postings in self.postings.items()}
+
+def merge_scores(position_parts, score_parts, size):
+    """Soma as contribuições positivas (posições, valores) de vários postings por posição; posições em ordem crescente"""
+    if not position_parts:
+        return np.empty(0, dtype=np.uint32), np.empty(0)
+    if len(position_parts) == 1:
+        return position_parts[0], score_parts[0]
+    positions, values = np.concatenate(position_parts), np.concatenate(score_parts)
+    if len(positions) * MERGE_DENSE_RATIO >= size:
+        # Muitas posições em relação à base: acumular num vetor denso sai mais barato que ordenar
+        dense = np.bincount(positions, weights=values, minlength=size)
+        positions = np.flatnonzero(dense)
+        return positions, dense[positions]
+    positions, inverse = np.unique(positions, return_inverse=True)
+    return positions, np.bincount(inverse, weights=values, minlength=len(positions))
+
+def top_positions(positions, scores, limit):
+    """Os `limit` maiores scores (argpartition), ordenados por score e, nos empates, pela posição"""
+    if len(scores) > limit:
+        # Empates no limite de corte ficam com as menores posições (argpartition escolheria qualquer uma)
+        threshold = np.partition(scores, len(scores) - limit)[len(scores) - limit]
+        above = np.flatnonzero(scores > threshold)
+        tied = np.flatnonzero(scores == threshold)
+        needed = limit - len(above)
+        if len(tied) > needed:
+            tied = tied[np.argpartition(positions[tied], needed - 1)[:needed]]
+        selected = np.concatenate((above, tied))
+        positions, scores = positions[selected], scores[selected]
+    order = np.lexsort((positions, -scores))
+    return [(int(positions[i]), float(scores[i])) for i in order]
+
+class TfidfEngine:
+    """
+    Motor TF-IDF vetorizado. A matriz termos x cenários (CSR, tf sublinear com os pesos de BM25_FIELD_BOOSTS,
+    colunas com norma L2) é compilada uma vez a partir do índice invertido; um lote de pedidos vira uma matriz
+    pedidos x termos e a busca é um único produto esparso, seguido de argpartition por pedido
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.size = index.size
+        self.term_ids = {term: term_id for term_id, term in enumerate(index.ranked_terms)}
+        self.idf = np.array([math.log((1 + index.size) / (1 + index.document_frequency[term])) + 1
+                             for term in index.ranked_terms], dtype=np.float32)
+
+        # Frequências ponderadas por campo; o mesmo termo em vários campos soma na mesma entrada
+        rows, columns, values = [], [], []
+        for field, boost in BM25_FIELD_BOOSTS.items():
+            for term, (positions, frequencies) in index.postings[field].items():
+                rows.append(np.full(len(positions), self.term_ids[term], dtype=np.int32))
+                columns.append(np.frombuffer(positions, dtype=np.uint32))
+                values.append(np.frombuffer(frequencies, dtype=np.uint32) * np.float32(boost))
+        matrix = self.compile(rows, columns, values, len(self.term_ids))
+        term_of_entry = np.repeat(np.arange(len(self.term_ids)), np.diff(matrix.indptr))
+        matrix.data = (1 + np.log(matrix.data)) * self.idf[term_of_entry]
+        norms = np.sqrt(np.bincount(matrix.indices, weights=matrix.data ** 2, minlength=self.size))
+        matrix.data /= norms[matrix.indices].astype(np.float32)
+        self.matrix = matrix
+
+        # Papéis dos personagens (filtro de público): matriz binária papéis x cenários
+        self.role_ids = {term: role_id for role_id, term in enumerate(index.terms["papel"])}
+        rows, columns, values = [], [], []
+        for term, (positions, _) in index.postings["papel"].items():
+            rows.append(np.full(len(positions), self.role_ids[term], dtype=np.int32))
+            columns.append(np.frombuffer(positions, dtype=np.uint32))
+            values.append(np.ones(len(positions), dtype=np.float32))
+        self.roles = self.compile(rows, columns, values, len(self.role_ids))
+
+    def compile(self, rows, columns, values, row_count):
+        """Matriz CSR (linhas x cenários) a partir de trechos de coordenadas"""
+        if not rows:
+            return sparse.csr_matrix((row_count, self.size), dtype=np.float32)
+        matrix = sparse.csr_matrix((np.concatenate(values), (np.concatenate(rows), np.concatenate(columns))),
+                                   shape=(row_count, self.size), dtype=np.float32)
+        matrix.sum_duplicates()
+        return matrix
+
+    def query_matrix(self, keyword_lists, terms, term_ids, weights=None):
+        """Matriz pedidos x termos (linhas com norma L2) a partir das palavras-chave de cada pedido"""
+        rows, columns = [], []
+        for row, query_keywords in enumerate(keyword_lists):
+            ids = {term_ids[term] for keyword in query_keywords for term in expand(terms, keyword)}
+            rows += [row] * len(ids)
+            columns += sorted(ids)
+        rows, columns = np.array(rows, dtype=np.int64), np.array(columns, dtype=np.int64)
+        data = weights[columns] if weights is not None else np.ones(len(columns), dtype=np.float32)
+        norms = np.sqrt(np.bincount(rows, weights=data ** 2, minlength=len(keyword_lists)))
+        data = (data / norms[rows]).astype(np.float32)
+        return sparse.csr_matrix((data, (rows, columns)), shape=(len(keyword_lists), len(terms)), dtype=np.float32)
+
+    def search_many(self, queries, limit):
+        """Melhores cenários [(posição, score)] de cada pedido (contexto, público), por similaridade de cosseno"""
+        contexts = [keywords(context) for context, _ in queries]
+        audiences = [keywords(audience) for _, audience in queries]
+        scores = self.query_matrix(contexts, self.index.ranked_terms, self.term_ids, self.idf) @ self.matrix
+        allowed = self.query_matrix(audiences, self.index.terms["papel"], self.role_ids) @ self.roles
+
+        results = []
+        for row in range(len(queries)):
+            allowed_positions = allowed.indices[allowed.indptr[row]:allowed.indptr[row + 1]]
+            if not contexts[row]:
+                # Sem termos de contexto não há ranking: primeiros cenários do público, na ordem dos arquivos
+                first = np.sort(allowed_positions)[:limit] if audiences[row] else np.arange(min(limit, self.size))
+                results.append([(int(position), 0.0) for position in first])
+                continue
+            positions = scores.indices[scores.indptr[row]:scores.indptr[row + 1]]
+            values = scores.data[scores.indptr[row]:scores.indptr[row + 1]]
+            if audiences[row]:
+                mask = np.zeros(self.size, dtype=bool)
+                mask[allowed_positions] = True
+                keep = mask[positions]
+                positions, values = positions[keep], values[keep]
+            results.append(top_positions(positions, values, limit))
+        return results
+
+class TextEmbedder:
+    """
+    Vetores de texto locais: contagens de n-gramas de caracteres (hash polinomial vetorizado em EMBEDDING_BUCKETS
+    posições), escala logarítmica e projeção aleatória gaussiana para EMBEDDING_DIM dimensões, com norma L2.
+    Captura variações de forma (plural, flexões, erros de digitação), não sinônimos
+    """
+
+    def __init__(self, ngrams=EMBEDDING_NGRAMS, buckets=EMBEDDING_BUCKETS, dim=EMBEDDING_DIM, seed=EMBEDDING_SEED):
+        self.ngrams, self.buckets, self.dim, self.seed = ngrams, buckets, dim, seed
+        self._projection = None
+
+    @property
+    def projection(self):
+        """Matriz de projeção (buckets x dim), gerada no primeiro uso a partir da semente"""
+        if self._projection is None:
+            rng = np.random.default_rng(self.seed)
+            self._projection = (rng.standard_normal((self.buckets, self.dim)) / np.sqrt(self.dim)).astype(np.float32)
+        return self._projection
+
+    def signature(self):
+        """Parâmetros que determinam os vetores (entram na impressão digital do índice em disco)"""
+        return f"ngrams={self.ngrams};buckets={self.buckets};dim={self.dim};seed={self.seed}"
+
+    def buckets_of(self, text):
+        """Posições de hash de todos os n-gramas do texto normalizado"""
+        data = np.frombuffer(f" {normalize_text(text)} ".encode("utf-8"), dtype=np.uint8).astype(np.uint64)
+        found = []
+        for size in self.ngrams:
+            if len(data) < size:
+                continue
+            hashes = np.zeros(len(data) - size + 1, dtype=np.uint64)
+            for offset in range(size):
+                hashes = hashes * np.uint64(1099511628211) + data[offset:len(data) - size + 1 + offset]
+            found.append((hashes * np.uint64(0x9E3779B97F4A7C15)) >> np.uint64(40))
+        if not found:
+            return np.zeros(0, dtype=np.int64)
+        return (np.concatenate(found) % np.uint64(self.buckets)).astype(np.int64)
+
+    def embed(self, texts, weights=None):
+        """
+        Matriz float32 (textos x dim). `texts` pode ter, por item, uma lista de trechos; com `weights`
+        cada trecho conta com o peso correspondente
+        """
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, parts in enumerate(texts):
+            parts = [parts] if isinstance(parts, str) else parts
+            counts = np.zeros(self.buckets, dtype=np.float32)
+            for part, weight in zip(parts, weights or [1.0] * len(parts)):
+                counts += np.bincount(self.buckets_of(part), minlength=self.buckets) * np.float32(weight)
+            # Projeção só das linhas com contagem (o vetor de contagens é esparso)
+            filled = np.flatnonzero(counts)
+            vectors[row] = np.log1p(counts[filled]) @ self.projection[filled]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return vectors / norms
+
+def nearest_centroids(vectors, centroids):
+    """Índice do centróide mais próximo (produto interno) de cada vetor, em blocos"""
+    return np.concatenate([np.argmax(vectors[start:start + EMBEDDING_CHUNK] @ centroids.T, axis=1)
+                           for start in range(0, len(vectors), EMBEDDING_CHUNK)])
+
+def kmeans(vectors, clusters, iterations=IVF_ITERATIONS, seed=EMBEDDING_SEED):
+    """Centróides (norma L2) e atribuição de cada vetor, por k-means esférico treinado numa amostra"""
+    rng = np.random.default_rng(seed)
+    sample = vectors
+    if len(vectors) > clusters * IVF_TRAINING_SAMPLE:
+        sample = vectors[rng.choice(len(vectors), clusters * IVF_TRAINING_SAMPLE, replace=False)]
+    centroids = sample[rng.choice(len(sample), clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = nearest_centroids(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        filled = norms[:, 0] > 0    # Listas que ficaram vazias mantêm o centróide anterior
+        centroids[filled] = sums[filled] / norms[filled]
+    return centroids, nearest_centroids(vectors, centroids)
+
+class SemanticIndex:
+    """
+    Índice semântico aproximado (IVF): os vetores dos cenários ficam agrupados pela lista do centróide mais
+    próximo; uma busca compara o pedido com os centróides e só percorre as IVF_PROBES listas mais próximas
+    """
+
+    # Campos embutidos no vetor de cada cenário, com os mesmos pesos do BM25
+    FIELDS = tuple(BM25_FIELD_BOOSTS)
+
+    def __init__(self, index, embedder, vectors, positions, offsets, centroids, fingerprint):
+        self.index = index              # Índice invertido (filtro de público)
+        self.embedder = embedder
+        self.vectors = vectors          # float32, linhas agrupadas por lista
+        self.positions = positions      # Posição do cenário de cada linha
+        self.offsets = offsets          # Linhas da lista i: offsets[i]:offsets[i + 1]
+        self.centroids = centroids
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def from_vectors(cls, index, embedder, vectors, fingerprint):
+        """Agrupa os vetores (um por cenário, na ordem dos cenários) em cerca de sqrt(n) listas"""
+        clusters = max(1, min(len(vectors), int(math.sqrt(len(vectors)))))
+        centroids, assignments = kmeans(vectors, clusters)
+        order = np.argsort(assignments, kind="stable")
+        offsets = np.searchsorted(assignments[order], np.arange(clusters + 1))
+        return cls(index, embedder, vectors[order], order.astype(np.uint32), offsets, centroids, fingerprint)
+
+    @classmethod
+    def build(cls, scenarios, index, embedder, fingerprint):
+        texts = [[scenario_text(scenario, field) for field in cls.FIELDS] for scenario in scenarios]
+        vectors = embedder.embed(texts, [BM25_FIELD_BOOSTS[field] for field in cls.FIELDS])
+        return cls.from_vectors(index, embedder, vectors, fingerprint)
+
+    def save(self, path):
+        """Grava o índice (npz); escrita atômica para processos concorrentes"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as f:
+            np.savez(f, vectors=self.vectors, positions=self.positions, offsets=self.offsets,
+                     centroids=self.centroids, fingerprint=np.array(self.fingerprint))
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path, index, embedder, fingerprint):
+        """Índice salvo em disco, ou None se ausente, ilegível ou de outra versão da base/parâmetros"""
+        try:
+            with np.load(path) as data:
+                if str(data["fingerprint"]) != fingerprint:
+                    return None
+                return cls(index, embedder, data["vectors"], data["positions"], data["offsets"],
+                           data["centroids"], fingerprint)
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def search_many(self, queries, limit):
+        """Vizinhos aproximados [(posição, similaridade de cosseno)] de cada pedido (contexto, público)"""
+        query_vectors = self.embedder.embed([context or "" for context, _ in queries])
+        centroid_scores = query_vectors @ self.centroids.T
+        probes = min(IVF_PROBES, len(self.centroids))
+
+        results = []
+        for row, (context, audience) in enumerate(queries):
+            if not keywords(context):
+                results.extend(self.index.search_many([(context, audience)], limit))
+                continue
+            lists = np.argpartition(-centroid_scores[row], probes - 1)[:probes]
+            # Listas são faixas contíguas: fatias (sem cópia) em vez de indexação por linhas
+            spans = [slice(self.offsets[i], self.offsets[i + 1]) for i in lists]
+            positions = np.concatenate([self.positions[span] for span in spans])
+            scores = np.concatenate([self.vectors[span] @ query_vectors[row] for span in spans])
+            audience_keywords = keywords(audience)
+            if audience_keywords:
+                keep = self.index.contains(("papel",), audience_keywords, positions)
+                positions, scores = positions[keep], scores[keep]
+            results.append(top_positions(positions, scores, limit))
+        return results
+
+class KnowledgeBase:
+    """Base de conhecimento carregada (somente leitura), compartilhada por todas as sessões do processo"""
+
+    def __init__(self, scenarios, libraries, report, load_seconds, aliases=None, duplicates=(), codec=None,
+                 index=None, index_dir=None, origin="json"):
+        self.scenarios = scenarios      # Tupla de Scenario canônicos, na ordem dos arquivos
+        self.libraries = libraries      # Chave -> conteúdo de J7-J10
+        self.report = report            # Um relatório por arquivo (origem, tamanho, hash, registros, problemas)
+        self.load_seconds = load_seconds
+        self.aliases = aliases or MappingProxyType({})  # Id duplicado ("J2.json#0") -> id canônico ("J1.json#0")
+        self.duplicates = duplicates    # Relatório de duplicatas de arquivo e de registro
+        self.codec = codec or ScenarioCodec()
+        self.index = index or InvertedIndex(scenarios)
+        self.index_dir = index_dir      # Onde salvar/ler índices derivados (None: só em memória)
+        self.origin = origin            # "json" (fontes decodificadas) ou "snapshot" (arquivo compilado)
+        self.snapshot_status = None     # Por que o snapshot não foi usado, quando não foi
+        self._engines = {}
+        self._engines_lock = threading.Lock()
+        self._bytes_per_scenario = None
+        self._template_keys = {}        # Id do cenário -> template_key, calculado no primeiro uso pela busca
+
+    def template_key(self, scenario):
+        key = self._template_keys.get(scenario.id)
+        if key is None:
+            key = self._template_keys[scenario.id] = template_key(scenario)
+        return key
+
+    def engine(self, name=DEFAULT_RETRIEVAL_ENGINE):
+        """
+        Motor de busca: o índice invertido (bm25), a matriz TF-IDF (tfidf) ou o índice semântico (semantico).
+        Os dois últimos são montados no primeiro uso; o semântico é lido do disco quando já foi salvo
+        """
+        if name == "tfidf" and sparse is None:
+            name = "bm25"
+        if name not in ("tfidf", "semantico"):
+            return self.index
+        with self._engines_lock:
+            if name not in self._engines:
+                self._engines[name] = TfidfEngine(self.index) if name == "tfidf" else self.semantic_index()
+            return self._engines[name]
+
+    def semantic_index(self):
+        """Índice semântico salvo em index_dir para esta versão da base, ou montado (e salvo) agora"""
+        embedder = TextEmbedder()
+        fingerprint = hashlib.sha256(f"{self.fingerprint()}|{embedder.signature()}".encode("utf-8")).hexdigest()
+        path = os.path.join(self.index_dir, "semantico.npz") if self.index_dir else None
+        semantic = SemanticIndex.load(path, self.index, embedder, fingerprint) if path else None
+        if semantic is None:
+            semantic = SemanticIndex.build(self.scenarios, self.index, embedder, fingerprint)
+            if path:
+                try:
+                    semantic.save(path)
+                except OSError:
+                    pass    # Sem permissão de escrita: o índice fica só em memória
+        return semantic
+
+    def fingerprint(self):
+        """Hash do conteúdo da base (hashes dos arquivos ou, sem arquivos, dos cenários), para invalidar índices em disco"""
+        digest = hashlib.sha256()
+        if self.report:
+            for item in self.report:
+                digest.update(f"{item['arquivo']}:{item['sha256']}\n".encode("utf-8"))
+            # Cenários canônicos, na ordem das posições: outra regra de deduplicação muda as posições indexadas
+            digest.update("|".join(scenario.id for scenario in self.scenarios).encode("utf-8"))
+        else:
+            for scenario in self.scenarios:
+                digest.update(f"{scenario.id}:{scenario.cenario}\n".encode("utf-8"))
+        return digest.hexdigest()
+
+    def canonical(self, scenario_id):
+        """Id canônico de um cenário (o próprio id se ele não for duplicata)"""
+        return self.aliases.get(scenario_id, scenario_id)
+
+    def bytes_per_scenario(self):
+        """Memória média por cenário, incluindo a parte compartilhada (vocabulários e tuplas de códigos)"""
+        if self._bytes_per_scenario is None:
+            self._bytes_per_scenario = deep_sizeof((self.scenarios, self.codec)) // max(len(self.scenarios), 1)
+        return self._bytes_per_scenario
+
+    def stats(self):
+        return {
+            'cenarios': len(self.scenarios),
+            'bibliotecas': len(self.libraries),
+            'arquivos': sum(1 for item in self.report if item['registros']),
+            'problemas': sum(len(item['problemas']) for item in self.report),
+            'arquivos_duplicados': sum(1 for item in self.duplicates if item['nivel'] == 'arquivo'),
+            'cenarios_duplicados': sum(1 for item in self.duplicates if item['nivel'] == 'registro'),
+            'bytes_por_cenario': self.bytes_per_scenario(),
+            'termos_indexados': sum(self.index.stats().values()),
+            'fonte': self.origin,
+            'carga_s': round(self.load_seconds, 3)
+        }
+
+def load_knowledge_base(directory=KNOWLEDGE_BASE_DIR, remote_url=None, workers=LOAD_WORKERS, index_dir=INDEX_CACHE_DIR,
+                        snapshot=SNAPSHOT_FILE):
+    """
+    Carrega J1-J10 em paralelo do diretório local (com fonte remota opcional para arquivos ausentes).
+    Se houver um snapshot compilado com os mesmos hashes das fontes, a base vem dele (mmap, sem decodificar JSON).
+    Senão, arquivos com o mesmo conteúdo (hash) são decodificados uma única vez e cenários repetidos
+    (mesmos campos normalizados) ficam só na primeira ocorrência; as demais viram aliases.
+    """
+    started = time.perf_counter()
+    file_names = list(SCENARIO_FILES) + list(LIBRARY_FILES)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        reads = list(executor.map(lambda name: read_file(name, directory, remote_url), file_names))
+
+        snapshot_status = None
+        if snapshot:
+            knowledge_base, snapshot_status = load_snapshot(snapshot, [file_report for _, file_report in reads],
+                                                            index_dir)
+            if knowledge_base is not None:
+                knowledge_base.load_seconds = time.perf_counter() - started
+                return knowledge_base
+
+        # Deduplicação de arquivos: o primeiro arquivo com um dado conteúdo é o canônico
+        first_by_hash, to_parse = {}, []
+        for file_name, (raw, file_report) in zip(file_names, reads):
+            if raw is None:
+                continue
+            key = (file_report['sha256'], file_name in SCENARIO_FILES)
+            if key in first_by_hash:
+                file_report['duplicado_de'] = first_by_hash[key]
+            else:
+                first_by_hash[key] = file_name
+                to_parse.append((file_name, raw, file_report))
+        parsed = dict(zip([item[0] for item in to_parse], executor.map(lambda item: parse_file(*item), to_parse)))
+
+    scenarios, libraries, report = [], {}, []
+    aliases, duplicates, first_by_record = {}, [], {}
+    codec = ScenarioCodec()
+    for file_name, (_, file_report) in zip(file_names, reads):
+        report.append(file_report)
+        canonical_file = file_report['duplicado_de']
+        if canonical_file:
+            canonical_report = report[file_names.index(canonical_file)]
+            file_report['registros'] = canonical_report['registros']
+            duplicates.append({'nivel': 'arquivo', 'alias': file_name, 'canonico': canonical_file})
+        data = parsed.get(canonical_file or file_name)
+        if data is None:
+            continue
+
+        if file_name not in SCENARIO_FILES:
+            # Bibliotecas duplicadas compartilham o mesmo objeto
+            libraries[LIBRARY_FILES[file_name]] = data
+            continue
+
+        for index, record in enumerate(data):
+            scenario_id = f"{file_name}#{index}"
+            if canonical_file:
+                # Registro de um arquivo duplicado: aponta para o canônico do registro correspondente
+                source_id = f"{canonical_file}#{index}"
+                aliases[scenario_id] = aliases.get(source_id, source_id)
+                continue
+            key = record_hash(record)
+            if key in first_by_record:
+                aliases[scenario_id] = first_by_record[key]
+                duplicates.append({'nivel': 'registro', 'alias': scenario_id, 'canonico': first_by_record[key]})
+                continue
+            first_by_record[key] = scenario_id
+            scenarios.append(codec.encode(scenario_id, SCENARIO_FILES[file_name], record))
+
+    if not scenarios and not libraries:
+        raise KnowledgeBaseError("Nenhum arquivo da base de conhecimento pôde ser carregado: " +
+                                 "; ".join(f"{item['arquivo']}: {item['problemas']}" for item in report))
+    knowledge_base = KnowledgeBase(tuple(scenarios), freeze(libraries), tuple(report), time.perf_counter() - started,
+                                   MappingProxyType(aliases), tuple(duplicates), codec, index_dir=index_dir)
+    knowledge_base.snapshot_status = snapshot_status
+    return knowledge_base
+
+def snapshot_format():
+    """Versão do formato e parâmetros que mudam o conteúdo compilado; outro valor invalida o snapshot"""
+    return (f"{SNAPSHOT_MAGIC.decode()};campos={','.join(InvertedIndex.FIELDS)};dedup={','.join(DEDUP_FIELDS)}/{TEMPLATE_NUMBER_PATTERN.pattern};"
+            f"tokens={TOKEN_PATTERN.pattern};{TextEmbedder().signature()}")
+
+def thaw(value):
+    """Inverso de freeze: JSON serializável"""
+    if isinstance(value, MappingProxyType):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(item) for item in value]
+    return value
+
+def pack_strings(values):
+    """Strings como (bytes UTF-8 concatenados, offsets)"""
+    encoded = [value.encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+    np.cumsum([len(item) for item in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+def unpack_strings(blob, offsets):
+    data, bounds = blob.tobytes(), offsets.tolist()
+    return [data[start:end].decode("utf-8") for start, end in zip(bounds, bounds[1:])]
+
+def pack_ragged(groups, width=None):
+    """Tuplas de tamanho variável como (códigos concatenados, offsets); `width` para tuplas de tuplas"""
+    offsets = np.zeros(len(groups) + 1, dtype=np.uint64)
+    np.cumsum([len(group) for group in groups], out=offsets[1:])
+    flat = [item for group in groups for item in group]
+    shape = (len(flat), width) if width else (len(flat),)
+    return np.array(flat, dtype=np.int32).reshape(shape), offsets
+
+def unpack_ragged(flat, offsets, share):
+    rows, bounds = flat.tolist(), offsets.tolist()
+    if flat.ndim == 2:
+        rows = [share(tuple(row)) for row in rows]
+    return [share(tuple(rows[start:end])) for start, end in zip(bounds, bounds[1:])]
+
+def write_snapshot(path, arrays, header):
+    """
+    Arquivo: SNAPSHOT_MAGIC, tamanho do cabeçalho (8 bytes), cabeçalho JSON (com dtype/forma/offset de cada
+    array) e os arrays alinhados; escrita atômica
+    """
+    layout, offset = {}, 0
+    for name, values in arrays.items():
+        offset = -(-offset // SNAPSHOT_ALIGNMENT) * SNAPSHOT_ALIGNMENT
+        layout[name] = {"dtype": values.dtype.str, "shape": list(values.shape), "offset": offset}
+        offset += values.nbytes
+    encoded = json.dumps(dict(header, arrays=layout), ensure_ascii=False).encode("utf-8")
+    data_start = -(-(len(SNAPSHOT_MAGIC) + 8 + len(encoded)) // SNAPSHOT_ALIGNMENT) * SNAPSHOT_ALIGNMENT
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(SNAPSHOT_MAGIC + len(encoded).to_bytes(8, "little") + encoded)
+        for name, values in arrays.items():
+            f.seek(data_start + layout[name]["offset"])
+            f.write(np.ascontiguousarray(values).tobytes())
+    os.replace(temporary, path)
+
+def read_snapshot(path):
+    """(cabeçalho, arrays) de um snapshot; os arrays são visões do arquivo mapeado em memória (sem cópia)"""
+    raw = np.memmap(path, dtype=np.uint8, mode="r").view(np.ndarray)   # Visão simples; o mapeamento segue vivo
+    if raw[:len(SNAPSHOT_MAGIC)].tobytes() != SNAPSHOT_MAGIC:
+        raise ValueError("não é um snapshot da base de conhecimento")
+    header_start = len(SNAPSHOT_MAGIC) + 8
+    header_size = int.from_bytes(raw[len(SNAPSHOT_MAGIC):header_start].tobytes(), "little")
+    header = json.loads(raw[header_start:header_start + header_size].tobytes().decode("utf-8"))
+    data_start = -(-(header_start + header_size) // SNAPSHOT_ALIGNMENT) * SNAPSHOT_ALIGNMENT
+    arrays = {}
+    for name, spec in header.pop("arrays").items():
+        dtype = np.dtype(spec["dtype"])
+        start = data_start + spec["offset"]
+        count = int(np.prod(spec["shape"], dtype=np.int64))
+        arrays[name] = raw[start:start + count * dtype.itemsize].view(dtype).reshape(spec["shape"])
+    return header, arrays
+
+def compile_snapshot(knowledge_base, path=SNAPSHOT_FILE):
+    """Grava a base (cenários, vocabulários, índice invertido e índice semântico) num snapshot binário"""
+    codec, index = knowledge_base.codec, knowledge_base.index
+    semantic = knowledge_base.engine("semantico")
+    for column in ScenarioCodec.COLUMNS:
+        if not all(isinstance(value, str) for value in codec.vocabularies[column].values):
+            raise KnowledgeBaseError(f"coluna '{column}' com valores que não são texto; snapshot não suportado")
+
+    arrays = {}
+    def put_strings(name, values):
+        arrays[f"{name}/blob"], arrays[f"{name}/offsets"] = pack_strings(values)
+
+    for column in ScenarioCodec.COLUMNS:
+        put_strings(f"vocabulario/{column}", codec.vocabularies[column].values)
+    scenarios = knowledge_base.scenarios
+    put_strings("cenarios/id", [scenario.id for scenario in scenarios])
+    put_strings("cenarios/cenario", [scenario.cenario for scenario in scenarios])
+    put_strings("cenarios/extras", [json.dumps(thaw(scenario.extras), ensure_ascii=False) if scenario.extras else ""
+                                    for scenario in scenarios])
+    for slot in ("tipo_code", "categoria_code", "complexidade_code", "analise_code", "estrategia_code"):
+        arrays[f"cenarios/{slot}"] = np.array([getattr(scenario, slot) for scenario in scenarios], dtype=np.int32)
+    arrays["cenarios/personagens"], arrays["cenarios/personagens_offsets"] = pack_ragged(
+        [scenario.personagens_codes for scenario in scenarios], width=4)
+    arrays["cenarios/dialogo"], arrays["cenarios/dialogo_offsets"] = pack_ragged(
+        [scenario.dialogo_codes for scenario in scenarios], width=2)
+    arrays["cenarios/tecnicas"], arrays["cenarios/tecnicas_offsets"] = pack_ragged(
+        [scenario.tecnicas_codes for scenario in scenarios])
+
+    for field in InvertedIndex.FIELDS:
+        terms = index.terms[field]
+        put_strings(f"indice/{field}/termos", terms)
+        postings = [index.postings[field][term] for term in terms]
+        offsets = np.zeros(len(terms) + 1, dtype=np.uint64)
+        np.cumsum([len(positions) for positions, _ in postings], out=offsets[1:])
+        arrays[f"indice/{field}/offsets"] = offsets
+        arrays[f"indice/{field}/posicoes"] = np.concatenate(
+            [np.frombuffer(positions, dtype=np.uint32) for positions, _ in postings] or [np.zeros(0, np.uint32)])
+        arrays[f"indice/{field}/frequencias"] = np.concatenate(
+            [np.frombuffer(frequencies, dtype=np.uint32) for _, frequencies in postings] or [np.zeros(0, np.uint32)])
+        arrays[f"indice/{field}/tamanhos"] = np.frombuffer(index.lengths[field], dtype=np.uint32)
+    put_strings("indice/ranqueados", index.ranked_terms)
+    arrays["indice/df"] = np.array([index.document_frequency[term] for term in index.ranked_terms], dtype=np.uint32)
+
+    arrays["semantico/vetores"] = semantic.vectors
+    arrays["semantico/posicoes"] = semantic.positions
+    arrays["semantico/offsets"] = semantic.offsets.astype(np.int64)
+    arrays["semantico/centroides"] = semantic.centroids
+
+    header = {
+        "formato": snapshot_format(),
+        "fontes": {item['arquivo']: item['sha256'] for item in knowledge_base.report},
+        "relatorio": list(knowledge_base.report),
+        "bibliotecas": thaw(knowledge_base.libraries),
+        "aliases": dict(knowledge_base.aliases),
+        "duplicados": list(knowledge_base.duplicates),
+        "medias": index.average_lengths,
+        "semantico": semantic.fingerprint,
+        "compilado_em": time.strftime("%Y-%m-%d %H:%M:%S")
+    }
+    write_snapshot(path, arrays, header)
+    return path
+
+def snapshot_staleness(header, reports):
+    """Motivo pelo qual o snapshot não vale para as fontes atuais (None se estiver em dia)"""
+    if header.get("formato") != snapshot_format():
+        return "formato ou parâmetros diferentes"
+    current = {item['arquivo']: item['sha256'] for item in reports}
+    changed = [name for name in sorted(set(current) | set(header["fontes"]))
+               if current.get(name) != header["fontes"].get(name)]
+    if changed:
+        return "fontes alteradas: " + ", ".join(changed)
+    return None
+
+def load_snapshot(path, reports, index_dir=INDEX_CACHE_DIR):
+    """(KnowledgeBase, None) a partir do snapshot, ou (None, motivo) se ausente, ilegível ou desatualizado"""
+    if not os.path.exists(path):
+        return None, "snapshot ausente"
+    try:
+        header, arrays = read_snapshot(path)
+        stale = snapshot_staleness(header, reports)
+        if stale:
+            return None, stale
+        return knowledge_base_from_snapshot(header, arrays, index_dir), None
+    except (OSError, ValueError, KeyError, UnicodeDecodeError) as e:
+        return None, f"snapshot ilegível: {e}"
+
+def knowledge_base_from_snapshot(header, arrays, index_dir):
+    """Reconstrói a base: cenários compactos a partir das colunas e índices como visões do arquivo mapeado"""
+    strings = lambda name: unpack_strings(arrays[f"{name}/blob"], arrays[f"{name}/offsets"])
+
+    codec = ScenarioCodec()
+    for column in ScenarioCodec.COLUMNS:
+        vocabulary = codec.vocabularies[column]
+        vocabulary.values = strings(f"vocabulario/{column}")
+        vocabulary.codes = {value: code for code, value in enumerate(vocabulary.values)}
+
+    columns = {slot: arrays[f"cenarios/{slot}"].tolist()
+               for slot in ("tipo_code", "categoria_code", "complexidade_code", "analise_code", "estrategia_code")}
+    personagens = unpack_ragged(arrays["cenarios/personagens"], arrays["cenarios/personagens_offsets"], codec.share)
+    dialogo = unpack_ragged(arrays["cenarios/dialogo"], arrays["cenarios/dialogo_offsets"], codec.share)
+    tecnicas = unpack_ragged(arrays["cenarios/tecnicas"], arrays["cenarios/tecnicas_offsets"], codec.share)
+    extras = strings("cenarios/extras")
+    scenarios = tuple(
+        Scenario(codec, sys.intern(scenario_id), columns["tipo_code"][i], columns["categoria_code"][i],
+                 columns["complexidade_code"][i], cenario, personagens[i], dialogo[i], columns["analise_code"][i],
+                 tecnicas[i], columns["estrategia_code"][i], freeze(json.loads(extras[i])) if extras[i] else None)
+        for i, (scenario_id, cenario) in enumerate(zip(strings("cenarios/id"), strings("cenarios/cenario")))
+    )
+
+    # Postings como memoryview sobre o arquivo mapeado: iteração e busca binária sem copiar os dados
+    index = InvertedIndex.__new__(InvertedIndex)
+    index.size = len(scenarios)
+    index.postings, index.lengths, index.terms = {}, {}, {}
+    for field in InvertedIndex.FIELDS:
+        terms = strings(f"indice/{field}/termos")
+        bounds = arrays[f"indice/{field}/offsets"].tolist()
+        positions, frequencies = arrays[f"indice/{field}/posicoes"], arrays[f"indice/{field}/frequencias"]
+        index.postings[field] = {
+            term: (memoryview(positions[start:end]), memoryview(frequencies[start:end]))
+            for term, start, end in zip(terms, bounds, bounds[1:])
+        }
+        index.lengths[field] = memoryview(arrays[f"indice/{field}/tamanhos"])
+        index.terms[field] = terms
+    index.average_lengths = header["medias"]
+    index.ranked_terms = strings("indice/ranqueados")
+    index.document_frequency = dict(zip(index.ranked_terms, arrays["indice/df"].tolist()))
+
+    knowledge_base = KnowledgeBase(
+        scenarios, freeze(header["bibliotecas"]), tuple(header["relatorio"]), 0.0,
+        MappingProxyType(header["aliases"]), tuple(header["duplicados"]), codec,
+        index=index, index_dir=index_dir, origin="snapshot"
+    )
+    knowledge_base._engines["semantico"] = SemanticIndex(
+        index, TextEmbedder(), arrays["semantico/vetores"], arrays["semantico/posicoes"],
+        arrays["semantico/offsets"], arrays["semantico/centroides"], header["semantico"]
+    )
+    return knowledge_base
+
+def scenario_text(scenario, field):
+    """Texto de um campo do cenário usado na busca ("dialogo" junta as mensagens)"""
+    if field == "dialogo":
+        return " ".join(message.get("mensagem", "") for message in scenario.get("dialogo", ()))
+    value = scenario.get(field, "")
+    return " ".join(value) if isinstance(value, tuple) else str(value)
+
+def get_relevant_scenarios(knowledge_base, context, audience=None, limit=3, engine=DEFAULT_RETRIEVAL_ENGINE):
+    """
+    Retorna os cenários mais relevantes para o contexto, entre os que têm o público nos papéis dos
+    personagens. Utiliza todos os níveis de complexidade automaticamente.
+    Cada item traz o cenário, o score e os termos do pedido encontrados em cada campo.
+    """
+    return get_relevant_scenarios_batch(knowledge_base, [(context, audience)], limit, engine)[0]
+
+def distinct_templates(knowledge_base, results, limit):
+    """
+    Os `limit` melhores resultados com no máximo um cenário por template; se os candidatos não tiverem
+    templates distintos suficientes, o restante é completado com os melhores repetidos
+    """
+    chosen, repeated, seen = [], [], set()
+    for position, score in results:
+        key = knowledge_base.template_key(knowledge_base.scenarios[position])
+        if key in seen:
+            repeated.append((position, score))
+            continue
+        seen.add(key)
+        chosen.append((position, score))
+        if len(chosen) == limit:
+            return chosen
+    return sorted(chosen + repeated[:limit - len(chosen)], key=lambda item: -item[1])
+
+def get_relevant_scenarios_batch(knowledge_base, queries, limit=3, engine=DEFAULT_RETRIEVAL_ENGINE):
+    """get_relevant_scenarios para vários pedidos (contexto, público) de uma vez (geração em lote)"""
+    ranked = [distinct_templates(knowledge_base, results, limit)
+              for results in knowledge_base.engine(engine).search_many(queries, limit * RETRIEVAL_CANDIDATES)]
+    return [
+        [{"cenario": knowledge_base.scenarios[position], "score": round(score, 3),
+          "termos": knowledge_base.index.explain(position, keywords(context))}
+         for position, score in results]
+        for (context, _), results in zip(queries, ranked)
+    ]
+
+def match_scenarios(knowledge_base, context, audience=None, limit=3):
+    """
+    Busca booleana pelo índice: alguma palavra-chave do contexto na descrição ou no diálogo e alguma do público
+    nos papéis dos personagens; primeiros resultados na ordem dos arquivos
+    """
+    index = knowledge_base.index
+    positions = intersect(index.matches(index.CONTEXT_FIELDS, keywords(context)),
+                          index.matches(("papel",), keywords(audience)))
+    return [knowledge_base.scenarios[position] for position, _ in zip(positions, range(limit))]
+
+def scan_relevant_scenarios(knowledge_base, context, audience=None, limit=3):
+    """Busca booleana sem índice (varredura de todos os cenários), mantida como referência para o benchmark"""
+    context_keywords, audience_keywords = keywords(context), keywords(audience)
+    all_relevant = []
+    for scenario in knowledge_base.scenarios:
+        text = tokenize(" ".join(InvertedIndex.FIELDS[field](scenario) for field in InvertedIndex.CONTEXT_FIELDS))
+        context_match = not context_keywords or any(
+            term.startswith(keyword) for keyword in context_keywords for term in text)
+        roles = tokenize(InvertedIndex.FIELDS["papel"](scenario))
+        audience_match = not audience_keywords or any(
+            term.startswith(keyword) for keyword in audience_keywords for term in roles)
+        if context_match and audience_match:
+            all_relevant.append(scenario)
+            if len(all_relevant) == limit:
+                break
+    return all_relevant
+
+# Pedidos usados no benchmark (contexto, público)
+BENCHMARK_QUERIES = [
+    ("Cliente quer ampliar o escopo do projeto sem aumentar o prazo", "cliente"),
+    ("Sponsor preocupado com riscos financeiros e atraso na entrega", "sponsor"),
+    ("Equipe técnica resistente às mudanças de processo", "equipe técnica"),
+    ("Reunião difícil com emoções fortes e frustração", ""),
+    ("Apresentação de más notícias sobre orçamento estourado", "diretoria executiva"),
+    ("Migração de datacenter exigida por auditoria externa", "auditor")   # sem resultados: varredura completa
+]
+
+def tile_index(index, size):
+    """Índice invertido de `size` cenários formado por cópias do índice dado (posições deslocadas)"""
+    tiled = InvertedIndex.__new__(InvertedIndex)
+    copies = -(-size // index.size)
+    offsets = (np.arange(copies, dtype=np.uint32) * index.size)[:, None]
+
+    def repeat(values, shift):
+        values = np.frombuffer(values, dtype=np.uint32)[None, :]
+        repeated = (values + offsets if shift else np.repeat(values, copies, axis=0)).ravel()
+        return repeated
+
+    tiled.size = size
+    tiled.postings = {}
+    for field, postings in index.postings.items():
+        tiled.postings[field] = {}
+        for term, (positions, frequencies) in postings.items():
+            tiled_positions, tiled_frequencies = repeat(positions, True), repeat(frequencies, False)
+            keep = tiled_positions < size
+            tiled.postings[field][term] = (array("I", tiled_positions[keep].tobytes()),
+                                           array("I", tiled_frequencies[keep].tobytes()))
+    tiled.lengths = {field: array("I", np.tile(np.frombuffer(lengths, dtype=np.uint32), copies)[:size].tobytes())
+                     for field, lengths in index.lengths.items()}
+    tiled.average_lengths = dict(index.average_lengths)
+    tiled.terms = index.terms
+    tiled.ranked_terms = index.ranked_terms
+    tiled.document_frequency = {
+        term: len(np.unique(np.concatenate([np.frombuffer(tiled.postings[field][term][0], dtype=np.uint32)
+                                            for field in BM25_FIELD_BOOSTS if term in tiled.postings[field]])))
+        for term in tiled.ranked_terms
+    }
+    return tiled
+
+def synthetic_knowledge_base(knowledge_base, size):
+    """Base sintética com `size` cenários, cópias dos cenários reais (para benchmarks de escala)"""
+    base = knowledge_base.scenarios
+    scenarios = tuple(base[position % len(base)] for position in range(size))
+    return KnowledgeBase(scenarios, {}, (), 0.0, codec=knowledge_base.codec, index=tile_index(knowledge_base.index, size))
+
+def synthetic_semantic_index(knowledge_base, synthetic, noise=0.05):
+    """Índice semântico da base sintética: vetores reais repetidos com ruído gaussiano (sem recalcular n-gramas)"""
+    semantic = knowledge_base.engine("semantico")
+    base = np.empty_like(semantic.vectors)
+    base[semantic.positions] = semantic.vectors
+    rng = np.random.default_rng(EMBEDDING_SEED)
+    vectors = np.tile(base, (-(-synthetic.index.size // len(base)), 1))[:synthetic.index.size]
+    vectors = vectors + rng.standard_normal(vectors.shape, dtype=np.float32) * np.float32(noise / np.sqrt(vectors.shape[1]))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return SemanticIndex.from_vectors(synthetic.index, semantic.embedder, vectors, "sintetico")
+
+def time_query(function, knowledge_base, repeat, **options):
+    """Latência média (µs) dos pedidos de BENCHMARK_QUERIES"""
+    timings = []
+    for context, audience in BENCHMARK_QUERIES:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            function(knowledge_base, context, audience, **options)
+            timings.append(time.perf_counter() - started)
+    return sum(timings) / len(timings) * 1e6
+
+def time_batch(knowledge_base, repeat, engine):
+    """Latência média (µs) por pedido quando BENCHMARK_QUERIES vão juntos num único lote"""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        get_relevant_scenarios_batch(knowledge_base, BENCHMARK_QUERIES, engine=engine)
+    return (time.perf_counter() - started) / (repeat * len(BENCHMARK_QUERIES)) * 1e6
+
+SCAN_BENCHMARK_LIMIT = 100000   # Acima disto a varredura sem índice não entra no benchmark (segundos por pedido)
+
+def benchmark(sizes, repeat=20):
+    """Latência da busca (BM25, TF-IDF, booleana com índice e por varredura) para bases de tamanhos crescentes"""
+    knowledge_base = load_knowledge_base()
+    slow_repeat = max(1, repeat // 10)
+    print(f"{'cenarios':>10} {'bm25_us':>10} {'tfidf_us':>10} {'tfidf_lote_us':>14} {'semantico_us':>13} "
+          f"{'indice_us':>10} {'varredura_us':>13} {'construcao_s':>13} {'tfidf_s':>8} {'ivf_s':>8}")
+    for size in sizes:
+        started = time.perf_counter()
+        synthetic = synthetic_knowledge_base(knowledge_base, size)
+        build_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        synthetic.engine("tfidf")
+        tfidf_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        synthetic._engines["semantico"] = synthetic_semantic_index(knowledge_base, synthetic)
+        ivf_seconds = time.perf_counter() - started
+
+        scan = "-"
+        if size <= SCAN_BENCHMARK_LIMIT:
+            for context, audience in BENCHMARK_QUERIES:
+                assert match_scenarios(synthetic, context, audience) == \
+                    scan_relevant_scenarios(synthetic, context, audience)
+            scan = f"{time_query(scan_relevant_scenarios, synthetic, slow_repeat):.1f}"
+        print(f"{size:>10} {time_query(get_relevant_scenarios, synthetic, slow_repeat, engine='bm25'):>10.1f} "
+              f"{time_query(get_relevant_scenarios, synthetic, repeat, engine='tfidf'):>10.1f} "
+              f"{time_batch(synthetic, repeat, 'tfidf'):>14.1f} "
+              f"{time_query(get_relevant_scenarios, synthetic, repeat, engine='semantico'):>13.1f} "
+              f"{time_query(match_scenarios, synthetic, repeat):>10.1f} "
+              f"{scan:>13} {build_seconds:>13.2f} {tfidf_seconds:>8.2f} {ivf_seconds:>8.2f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ferramentas da base de conhecimento do NEXUS")
+    commands = parser.add_subparsers(dest="command", required=True)
+    bench = commands.add_parser("benchmark", help="mede a latência da busca de cenários")
+    bench.add_argument("--sizes", type=int, nargs="+", default=[660, 10000, 100000])
+    bench.add_argument("--repeat", type=int, default=20)
+    compile_ = commands.add_parser("compile", help="compila a base num snapshot binário")
+    compile_.add_argument("--directory", default=KNOWLEDGE_BASE_DIR, help="diretório com J1-J10")
+    compile_.add_argument("--output", default=SNAPSHOT_FILE, help="arquivo do snapshot")
+    status = commands.add_parser("status", help="informa se o snapshot está em dia com as fontes")
+    status.add_argument("--directory", default=KNOWLEDGE_BASE_DIR, help="diretório com J1-J10")
+    status.add_argument("--output", default=SNAPSHOT_FILE, help="arquivo do snapshot")
+    args = parser.parse_args(argv)
+
+    if args.command == "benchmark":
+        benchmark(args.sizes, args.repeat)
+    elif args.command == "compile":
+        knowledge_base = load_knowledge_base(args.directory, snapshot=None)
+        started = time.perf_counter()
+        path = compile_snapshot(knowledge_base, args.output)
+        print(f"{path}: {len(knowledge_base.scenarios)} cenários, {os.path.getsize(path)} bytes, "
+              f"{time.perf_counter() - started:.2f}s")
+    elif args.command == "status":
+        knowledge_base = load_knowledge_base(args.directory, snapshot=args.output)
+        print(f"{args.output}: {'em dia' if knowledge_base.origin == 'snapshot' else knowledge_base.snapshot_status} "
+              f"(carga {knowledge_base.load_seconds * 1000:.1f} ms)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Os testes importam app.py e nexus_kb.py da raiz do repositório
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
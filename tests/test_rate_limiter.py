@@ -0,0 +1,50 @@
+import json
+import threading
+import time
+
+import pytest
+
+import app
+
+
+def empty_limiter(tmp_path, max_wait):
+    """Limitador de 60 requisições/min (uma por segundo) com o bucket de requisições vazio"""
+    state_path = tmp_path / "rate_limit.json"
+    state_path.write_text(json.dumps({'requests': 0, 'tokens': 100000, 'updated_at': time.time()}))
+    return app.GlobalRateLimiter(str(state_path), 60, 100000, max_wait)
+
+
+def test_new_session_is_not_rejected_by_another_sessions_backlog(tmp_path):
+    limiter = empty_limiter(tmp_path, max_wait=5)
+    outcomes = []
+
+    def request(session_id):
+        try:
+            limiter.acquire(session_id, 10)
+            outcomes.append((session_id, "ok"))
+        except app.RateLimitExceeded:
+            outcomes.append((session_id, "rejeitado"))
+
+    # Sessão "a" com fila de 5 pedidos (o último espera ~5 s)
+    backlog = [threading.Thread(target=request, args=("a",)) for _ in range(5)]
+    for thread in backlog:
+        thread.start()
+        time.sleep(0.02)
+
+    # O primeiro pedido de "b" entra na próxima rodada do rodízio, não no fim da fila de "a"
+    started = time.time()
+    request("b")
+    assert outcomes[-1] == ("b", "ok")
+    assert time.time() - started < 3
+    assert sum(1 for session_id, _ in outcomes if session_id == "a") < 5
+
+    for thread in backlog:
+        thread.join()
+
+
+def test_deep_own_backlog_is_still_rejected_early(tmp_path):
+    limiter = empty_limiter(tmp_path, max_wait=2)
+    with limiter._cond:
+        limiter._queues["a"] = [(object(), time.time(), 10) for _ in range(5)]
+    with pytest.raises(app.RateLimitExceeded):
+        limiter.acquire("a", 10)
@@ -0,0 +1,19 @@
+import pytest
+
+from nexus_kb import RETRIEVAL_ENGINES, get_relevant_scenarios, load_knowledge_base, template_key
+
+
+@pytest.fixture(scope="module")
+def knowledge_base():
+    return load_knowledge_base()
+
+
+@pytest.mark.parametrize("engine", RETRIEVAL_ENGINES)
+def test_top_k_has_one_scenario_per_template(knowledge_base, engine):
+    # Os cenários J1.json#30, #31 e #33 são o mesmo template com técnicas diferentes
+    results = get_relevant_scenarios(knowledge_base, "Cliente quer ampliar o escopo do projeto sem aumentar o prazo",
+                                     "cliente", limit=3, engine=engine)
+    assert len(results) == 3
+    assert len({template_key(result["cenario"]) for result in results}) == 3
+    scores = [result["score"] for result in results]
+    assert scores == sorted(scores, reverse=True)
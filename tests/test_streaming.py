@@ -0,0 +1,103 @@
+import json
+import logging
+import socket
+import threading
+import time
+
+import pytest
+import requests
+
+import app
+
+
+class FakeStreamResponse:
+    """Resposta SSE simulada: devolve as linhas recebidas, uma por iteração"""
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.encoding = None
+        self.closed = False
+
+    def iter_lines(self, decode_unicode=False):
+        for line in self.lines:
+            if self.closed:
+                return
+            yield line
+
+    def close(self):
+        self.closed = True
+
+
+def sse(event):
+    return "data: " + json.dumps(event)
+
+
+def delta(text, finish_reason=None):
+    return sse({"choices": [{"delta": {"content": text}, "finish_reason": finish_reason}]})
+
+
+def test_malformed_chunk_is_skipped_and_logged(caplog):
+    response = FakeStreamResponse([
+        delta("Olá, "),
+        "data: {\"choices\": [{\"delta\": ",
+        "data: [1, 2]",
+        delta("equipe.", "stop"),
+        sse({"choices": [], "usage": {"total_tokens": 7}}),
+        "data: [DONE]",
+    ])
+    with caplog.at_level(logging.WARNING, logger="nexus"):
+        content, usage, finish_reason = app.read_streamed_completion(response, lambda text: None)
+
+    assert content == "Olá, equipe."
+    assert usage == {"total_tokens": 7}
+    assert finish_reason == "stop"
+    assert len([record for record in caplog.records if "SSE" in record.getMessage()]) == 2
+
+
+def test_error_event_raises_stream_error():
+    response = FakeStreamResponse([
+        delta("Olá"),
+        sse({"error": {"message": "The server had an error while processing your request.", "type": "server_error"}}),
+        delta(" nunca lido"),
+    ])
+    with pytest.raises(app.StreamError, match="server had an error") as raised:
+        app.read_streamed_completion(response, lambda text: None)
+
+    assert raised.value.error["type"] == "server_error"
+    assert response.closed
+
+
+@pytest.fixture
+def stalled_server():
+    """Servidor SSE que envia um evento e para de responder sem fechar a conexão"""
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen()
+    release = threading.Event()
+
+    def serve():
+        connection, _ = server.accept()
+        connection.recv(65536)
+        connection.sendall(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n")
+        chunk = (delta("Olá") + "\n\n").encode("utf-8")
+        connection.sendall(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+        release.wait(30)
+        connection.close()
+
+    threading.Thread(target=serve, daemon=True).start()
+    yield f"http://127.0.0.1:{server.getsockname()[1]}/"
+    release.set()
+    server.close()
+
+
+def test_cancel_interrupts_a_stalled_stream(stalled_server):
+    response = requests.post(stalled_server, data="{}", stream=True, timeout=(3, 20))
+    cancel = threading.Event()
+    threading.Timer(0.5, cancel.set).start()
+
+    started = time.time()
+    content, usage, finish_reason = app.read_streamed_completion(response, lambda text: None, cancel)
+
+    assert time.time() - started < 3
+    assert content == "Olá"
+    assert usage is None